@@ -0,0 +1,150 @@
+import argparse, json, math, os, random, sys, tempfile, numpy
+
+import langserver_conf as lsc
+
+# Benchmarks run offline; names come from a stub instead of the language server.
+lsc.UseStub = True
+
+import gen, profiler, renderer
+
+DefaultPointCounts = [1000, 4000, 8000, 32000, 128000]
+DefaultSeed = 1234
+
+# Stages that scale worse than this (t ~ n^k) are reported as super-linear.
+MaxExponent = 1.3
+
+def run_once(point_count, seed, render=True):
+    '''
+    Generate (and optionally render) a single world and return the wall time of every
+    stage in milliseconds, keyed by stage name.
+    '''
+    random.seed(seed)
+
+    prof = profiler.activate( profiler.Profiler() )
+
+    try:
+        (w, vd) = gen.build_world(point_count, seed, verbose=False)
+
+        # Run plugins one at a time so their timings don't interfere with each other.
+        gen.generate_world(w, vd, workers=1, verbose=False)
+
+        if render:
+            with tempfile.TemporaryDirectory() as folder:
+                opts = renderer.RenderOptions()
+                opts.filename = os.path.join(folder, 'bench.png')
+
+                renderer.print_render(w, vd, opts)
+    finally:
+        profiler.deactivate()
+
+    return { stage.name: stage.wall_ms for stage in prof.stages }
+
+def scaling_exponent(point_counts, times):
+    '''
+    Fit t = c * n^k with least squares in log-log space and return k. Returns None if there
+    aren't at least two usable measurements.
+    '''
+    pairs = [(n, t) for n, t in zip(point_counts, times) if t is not None and t > 0]
+
+    if len(pairs) < 2:
+        return None
+
+    log_n = numpy.log([n for n, _ in pairs])
+    log_t = numpy.log([t for _, t in pairs])
+
+    return numpy.polyfit(log_n, log_t, 1)[0]
+
+def run(point_counts, seed, repeat=1, render=True, warmup=True):
+    '''
+    Benchmark every stage at each point count. Each measurement is the fastest of `repeat`
+    runs. Returns a dict of stage name => { 'times': [...], 'exponent': k }.
+
+    With `warmup`, one untimed run at the smallest point count goes first so that one-time
+    costs (imports, numba compilation, first-call caches) don't land in the first measurement
+    and skew the fitted exponents.
+    '''
+    results = {}
+
+    if warmup and len(point_counts) > 0:
+        print('Warming up...', flush=True)
+        run_once(min(point_counts), seed, render)
+
+    for idx, point_count in enumerate(point_counts):
+        print('Benchmarking {} points...'.format(point_count), flush=True)
+
+        best = {}
+        for _ in range(repeat):
+            for name, wall_ms in run_once(point_count, seed, render).items():
+                best[name] = min(best.get(name, math.inf), wall_ms)
+
+        for name, wall_ms in best.items():
+            if name not in results:
+                results[name] = { 'times': [None,] * len(point_counts) }
+
+            results[name]['times'][idx] = wall_ms
+
+    for name, result in results.items():
+        result['exponent'] = scaling_exponent(point_counts, result['times'])
+
+    return results
+
+def report(point_counts, results, max_exponent):
+    '''
+    Print a table of timings and return the names of all super-linear stages.
+    '''
+    name_width = max( [len(name) for name in results] + [5,] )
+
+    header = 'stage'.ljust(name_width) + ''.join( ['{:>12}'.format('n=%d' % (n,)) for n in point_counts] ) + '{:>10}'.format('k')
+    print('')
+    print(header)
+    print('-' * len(header))
+
+    flagged = []
+
+    for name, result in results.items():
+        times = ''.join( ['{:>12}'.format('-' if t is None else '%.1fms' % (t,)) for t in result['times']] )
+        exponent = result['exponent']
+
+        line = name.ljust(name_width) + times + '{:>10}'.format('-' if exponent is None else '%.2f' % (exponent,))
+
+        if exponent is not None and exponent > max_exponent:
+            flagged.append(name)
+            line += '  << super-linear'
+
+        print(line)
+
+    return flagged
+
+def main(argv=None):
+    '''
+    Run the benchmark from the command line. Returns the process exit status, which is 1 if
+    any stage scales worse than `--max-exponent`.
+    '''
+    parser = argparse.ArgumentParser(description='Measure how each generation and render stage scales with PointCount.')
+    parser.add_argument('--points', default=','.join( map(str, DefaultPointCounts) ), help='comma-separated point counts')
+    parser.add_argument('--seed', type=int, default=DefaultSeed)
+    parser.add_argument('--repeat', type=int, default=1, help='keep the fastest of N runs per point count')
+    parser.add_argument('--no-render', action='store_true', help='skip the render stages')
+    parser.add_argument('--no-warmup', action='store_true', help='skip the untimed warmup run')
+    parser.add_argument('--max-exponent', type=float, default=MaxExponent)
+    parser.add_argument('--json', help='also write results to this file')
+    args = parser.parse_args(argv)
+
+    point_counts = [int(n) for n in args.points.split(',')]
+
+    results = run(point_counts, args.seed, repeat=args.repeat, render=not args.no_render, warmup=not args.no_warmup)
+    flagged = report(point_counts, results, args.max_exponent)
+
+    if args.json:
+        with open(args.json, 'w') as fp:
+            json.dump({ 'point_counts': point_counts, 'seed': args.seed, 'stages': results }, fp, indent=2)
+
+    if len(flagged) > 0:
+        print('')
+        print('{} stage(s) scale worse than n^{}: {}'.format(len(flagged), args.max_exponent, ', '.join(flagged)))
+        return 1
+
+    return 0
+
+if __name__ == '__main__':
+    sys.exit( main() )
@@ -0,0 +1,197 @@
+import hashlib, inspect, os, pickle, sys, tempfile, numpy
+import profiler
+
+# Default size cap for a cache folder.
+MaxBytes = 512 * 1024 * 1024
+
+class PluginCache(object):
+    '''
+    On-disk cache of plugin outputs. Entries are content-addressed: the key is a hash of
+    everything that can affect what a plugin produces, which is
+
+    - the plugin's name, and the source code of the plugin and of every project module it
+      imports (directly or through other project modules),
+    - the world seed and the location of every Voronoi point,
+    - the contents of each cell property and world param the plugin declares as an input.
+
+    Each entry holds the plugin's declared outputs (`produces` and `mutates`) and any entities
+    it added to the world. Changing an upstream plugin changes its outputs, which changes the
+    keys of everything downstream, so stale entries are never used; they're just orphaned.
+
+    Orphans and entries for old seeds are evicted least recently used first whenever the
+    cache grows past `max_bytes`.
+    '''
+
+    def __init__(self, folder, max_bytes=MaxBytes):
+        self.folder = folder
+        self.max_bytes = max_bytes
+        self._source_digests = {}
+
+        os.makedirs(self.folder, exist_ok=True)
+
+    def key(self, plugin, world, vd, requirements):
+        h = hashlib.sha256()
+
+        h.update(plugin.__name__.encode('utf-8'))
+        h.update(self._source_digest(plugin, world, vd))
+
+        h.update(str(world.seed).encode('utf-8'))
+        h.update(numpy.ascontiguousarray(vd.vor.points).tobytes())
+
+        for name in sorted(requirements):
+            h.update(name.encode('utf-8'))
+
+            if world.has_cell_property(name):
+                h.update( array_digest(getattr(world, 'cp_%s' % (name,))) )
+            else:
+                h.update( repr(world.get_param(name)).encode('utf-8') )
+
+        return h.hexdigest()
+
+    def _source_digest(self, plugin, world, vd):
+        if plugin.__name__ not in self._source_digests:
+            h = hashlib.sha256()
+
+            # Plugins also call into the world's graph and the diagram without importing them.
+            modules = project_modules(plugin, world, world.graph, vd)
+
+            for module in sorted(modules, key=lambda module: module.__name__):
+                h.update(module.__name__.encode('utf-8'))
+                h.update(inspect.getsource(module).encode('utf-8'))
+
+            self._source_digests[plugin.__name__] = h.digest()
+
+        return self._source_digests[plugin.__name__]
+
+    def _filename(self, plugin, key):
+        return os.path.join(self.folder, plugin.__name__, '%s.pickle' % (key,))
+
+    def load(self, plugin, key, world):
+        '''
+        Apply a cached result to the world. Returns False if there's no entry for `key`.
+        '''
+        filename = self._filename(plugin, key)
+
+        if not os.path.exists(filename):
+            profiler.count('cache.miss')
+            return False
+
+        with open(filename, 'rb') as fp:
+            entry = pickle.load(fp)
+
+        # Mark the entry as recently used so eviction keeps it.
+        os.utime(filename)
+
+        for name, arr in entry['cellprops'].items():
+            world.add_cell_property(name, arr)
+
+        for name, value in entry['params'].items():
+            world.set_param(name, value)
+
+        for entity in entry['entities']:
+            world.add_entity(entity)
+
+        profiler.count('cache.hit')
+        return True
+
+    def store(self, plugin, key, world, outputs, entities):
+        entry = {
+            'cellprops': {},
+            'params': {},
+            'entities': entities,
+        }
+
+        for name in outputs:
+            if world.has_cell_property(name):
+                entry['cellprops'][name] = getattr(world, 'cp_%s' % (name,))
+            else:
+                entry['params'][name] = world.get_param(name)
+
+        filename = self._filename(plugin, key)
+        os.makedirs(os.path.dirname(filename), exist_ok=True)
+
+        # Write to a temp file and rename so that concurrent workers never see a partial entry.
+        (fd, tmp_filename) = tempfile.mkstemp(dir=os.path.dirname(filename))
+        with os.fdopen(fd, 'wb') as fp:
+            pickle.dump(entry, fp, protocol=pickle.HIGHEST_PROTOCOL)
+
+        os.replace(tmp_filename, filename)
+
+        self.evict()
+
+    def evict(self):
+        '''
+        Delete the least recently used entries until the cache fits in `max_bytes`.
+        '''
+        entries = []
+        for dirpath, _, filenames in os.walk(self.folder):
+            for filename in filenames:
+                if filename.endswith('.pickle'):
+                    path = os.path.join(dirpath, filename)
+
+                    try:
+                        stat = os.stat(path)
+                    except FileNotFoundError:
+                        continue    # evicted by another worker
+
+                    entries.append( (stat.st_mtime, stat.st_size, path) )
+
+        total = sum( [size for _, size, _ in entries] )
+
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+            total -= size
+            profiler.count('cache.evict')
+
+# Modules in this folder (and below it) are part of the project; everything else is a library.
+ProjectRoot = os.path.dirname( os.path.abspath(__file__) )
+
+def is_project_module(module):
+    filename = getattr(module, '__file__', None)
+
+    return filename is not None and os.path.abspath(filename).startswith(ProjectRoot + os.sep)
+
+def project_modules(*roots):
+    '''
+    Every project module that the `roots` (modules, or objects standing in for the module their
+    class is defined in) depend on: anything they import, or that the classes and functions they
+    import are defined in, followed transitively.
+    '''
+    found = {}
+
+    for root in roots:
+        module = root if inspect.ismodule(root) else sys.modules.get(type(root).__module__)
+
+        if module is not None and is_project_module(module):
+            found[module.__name__] = module
+
+    queue = list( found.values() )
+
+    while len(queue) > 0:
+        module = queue.pop()
+
+        for value in list( vars(module).values() ):
+            dependency = value if inspect.ismodule(value) else sys.modules.get( getattr(value, '__module__', None) or '' )
+
+            if dependency is not None and dependency.__name__ not in found and is_project_module(dependency):
+                found[dependency.__name__] = dependency
+                queue.append(dependency)
+
+    return list( found.values() )
+
+def array_digest(arr):
+    '''
+    Hash the contents of a cell property array. Object arrays (i.e. Cell.Type values) are
+    hashed by value since their raw bytes are just pointers.
+    '''
+    if arr.dtype == object:
+        arr = numpy.array([getattr(val, 'value', val) for val in arr])
+
+    return hashlib.sha256( numpy.ascontiguousarray(arr).tobytes() ).digest()
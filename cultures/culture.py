@@ -11,6 +11,13 @@ class Culture(object):
         self.lang = lang
         self.world = world
 
+    def __getstate__(self):
+        '''
+        Entities like cities refer to their culture and get pickled into the plugin cache. Only
+        keep the language; everything else is derived from the world the culture was created for.
+        '''
+        return { 'lang': self.lang, 'world': None }
+
     def city_survivability(self, idx, other_idx):
         raise NotImplementedError()
 
@@ -6,13 +6,7 @@ class HumanCulture(culture.Culture):
     def __init__(self, lang, world):
         super().__init__(lang, world)
 
-        def edge_filter(edge):
-            (src, dest) = edge
-
-            return self.world.cp_celltype[src] == Cell.Type.LAND and \
-                self.world.cp_celltype[dest] == Cell.Type.LAND
-
-        self.landgraph = world.graph.subgraph(edge_filter)
+        self.landgraph = world.subgraph('celltype', Cell.Type.LAND)
     
     def city_survivability(self, idx, others_idx):
         '''
@@ -1,6 +1,6 @@
 import functools
 
-def genreq(cellprops=[], entities=[], worldparams=[]):
+def genreq(cellprops=[], entities=[], worldparams=[], produces=[], mutates=[]):
     # Return the decorator function with the parameters above available via closures.
     def funcdec(func):
         @functools.wraps(func)
@@ -12,6 +12,8 @@ def genreq(cellprops=[], entities=[], worldparams=[]):
         setattr(dec, 'cellprops', cellprops)
         setattr(dec, 'entities', entities)
         setattr(dec, 'worldparams', worldparams)
+        setattr(dec, 'produces', produces)
+        setattr(dec, 'mutates', mutates)
 
         return dec
     
@@ -1,6 +1,15 @@
-import langserver_conf as lsc
+import threading
+import langserver_conf as lsc, profiler
 
-lc = lsc.GetClient()
+# ServerProxy isn't safe to share across threads and plugins can run concurrently, so each
+# thread gets its own client.
+clients = threading.local()
+
+def client():
+    if not hasattr(clients, 'lc'):
+        clients.lc = lsc.GetClient()
+
+    return clients.lc
 
 class Entity(object):
     def __init__(self, graph, name=None):
@@ -23,7 +32,8 @@ class Entity(object):
         raise NotImplementedError('Entity does not leverage stage 2 for rendering')
 
     def fetch_name(self, language, entity_type, params):
-        self.name = lc.get_name(language, entity_type, params)
+        profiler.count('langserver.get_name')
+        self.name = client().get_name(language, entity_type, params)
 
     @staticmethod
     def _transform_pt(pt):
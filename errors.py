@@ -1,3 +1,15 @@
 
 class InvalidCellError(Exception):
-    pass
\ No newline at end of file
+    pass
+
+class UnsatisfiableDependencyError(Exception):
+    pass
+
+class DependencyCycleError(Exception):
+    pass
+
+class WriteConflictError(Exception):
+    pass
+
+class MissingOutputError(Exception):
+    pass
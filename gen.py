@@ -1,115 +1,120 @@
-import datetime, random, sys, numpy, pkgutil, importlib, time, os
-import voronoi, graph, renderer, world
-
-import plugins
+import argparse, datetime, multiprocessing, random, numpy, os
+import voronoi, graph, renderer, world, scheduler, profiler, cache
 
 # Configuration variables
 PointCount = 8000      # default = 3500
 NumWorlds = 1
-
-def generate(world_idx):
+PluginWorkers = 4     # number of independent plugins that can run at the same time
+ProfileOutput = True  # write profile.json and trace.json (Chrome trace format) next to each world
+OutputFolder = 'gallery'
+CacheFolder = '.plugin-cache'  # where `--cache` keeps plugin outputs to reuse across runs with the same seed and inputs
+
+def build_world(point_count, seed, verbose=True):
+    '''
+    Build the spatial structure of a new world: the relaxed Voronoi diagram and the graph of
+    neighboring cells. The returned World doesn't have any plugins applied yet.
+    '''
     def point_cloud(n):
-        return numpy.random.rand(n, 2)
-
-    def generate_world(world, vd):
-        available_cellprops = []
-        available_worldparams = []
-
-        def is_ready(plugin):
-            '''
-            Determine whether all pre-requisites are satisfied. If yes, its safe to run this plugin
-            given the current state of the world.
-            '''
-            genfunc = plugin.generate
-
-            if hasattr(genfunc, 'cellprops'):
-                for cp in genfunc.cellprops:
-                    if cp not in available_cellprops:
-                        return False
-
-            if hasattr(genfunc, 'worldparams'):
-                for wp in genfunc.worldparams:
-                    if wp not in available_worldparams:
-                        return False
-
-            return True
-
-        def all_plugins():
-            '''
-            Dynamically load all plugins from the `plugins/` directory.
-            '''
-            plugin_list = pkgutil.iter_modules(plugins.__path__, plugins.__name__ + '.')
-            
-            modules = []
-            for _, name, __ in plugin_list:
-                pl = importlib.import_module(name)
-                modules.append(pl)
-            
-            return modules
-
-        plugin_queue = all_plugins()
-        plugin_count = len(plugin_queue)
-
-        while len(plugin_queue) > 0:
-            available_plugins = list( filter(is_ready, plugin_queue) )
-
-            for pl in available_plugins:
-                print('   * [{} / {}] Running {}...\t'.format(
-                        plugin_count - len(plugin_queue) + 1,
-                        plugin_count,
-                        pl.__name__
-                    ),
-                    end='',
-                    flush=True,
-                )
-
-                start_ts = time.time() * 1000
-                pl.generate(world, vd)
-                end_ts = time.time() * 1000
-
-                print( '[%.1fms]' % (round(end_ts - start_ts, 1)) )
-
-                # Once run, remove the plugin from the queue
-                plugin_queue.remove(pl)
-            
-            available_cellprops = list( map(lambda k: k[3:], filter(lambda k: k.startswith('cp_'), world.__dict__.keys())) )
-            available_worldparams = world.list_params()
-
-    # Seed RNG once per iteration
-    seed = round( datetime.datetime.now().timestamp() * 10000 )
+        return world.random_stream(seed, 'points').random((n, 2))
+
+    if verbose:
+        print('  [------] Generating Voronoi points for world...')
+
+    with profiler.stage('voronoi.generate', 'setup'):
+        points = point_cloud(point_count)
+        vor = voronoi.generate(points)
+
+    cell_idxs = [idx for idx in range(point_count)]
+    cell_mapping = voronoi.CellMapping.from_points(vor, point_count)
+
+    if verbose:
+        print('  [------] Building world graph...')
+
+    with profiler.stage('graph.BuildGraph', 'setup'):
+        worldgraph = graph.BuildGraph(cell_idxs, vor, cell_mapping)
+
+    w = world.World(cell_idxs, vor, worldgraph, seed, cell_mapping)
+
+    with profiler.stage('voronoi.VoronoiDiagram', 'setup'):
+        vd = voronoi.VoronoiDiagram(vor, cell_mapping)
+
+    return (w, vd)
+
+def generate_world(world, vd, workers=PluginWorkers, verbose=True, plugin_cache=None, on_finish=None):
+    '''
+    Run all plugins against the world. Plugins with an entry in `plugin_cache` are loaded
+    instead of run. `on_finish(plugin, elapsed_ms, cached)` is called as each plugin completes.
+    '''
+    sched = scheduler.Scheduler( scheduler.load_plugins() )
+    plugin_count = len(sched.order)
+    finished = []
+
+    def report(pl, elapsed_ms, cached):
+        finished.append(pl)
+
+        if verbose:
+            print('   * [{} / {}] {} {}\t[{:.1f}ms]'.format(
+                len(finished),
+                plugin_count,
+                'Loaded' if cached else 'Ran',
+                pl.__name__,
+                elapsed_ms,
+            ), flush=True)
+
+        if on_finish is not None:
+            on_finish(pl, elapsed_ms, cached)
+
+    sched.run(world, vd, workers=workers, on_finish=report, cache=plugin_cache)
+
+def generate(world_idx, seed, output_folder, plugin_workers=PluginWorkers, cache_folder=None, force=False):
+    '''
+    Generate, render and save a single world into its own folder inside `output_folder`.
+    Returns the path of the world's folder. If `cache_folder` is set, plugin outputs are
+    cached there.
+
+    A world whose folder already exists is skipped unless `force` is set, in which case it's
+    generated again and its files are overwritten.
+    '''
+    # Folder names are derived from the seed, so they can't collide within a batch. An existing
+    # folder means this seed was already generated, so check before doing any of the work.
+    folder = os.path.join(output_folder, '%05d-%d' % (world_idx, seed))
+
+    if os.path.isdir(folder) and not force:
+        print('  [------] Skipping world #{}, {} already exists'.format(world_idx + 1, folder))
+        return folder
+
+    os.makedirs(folder, exist_ok=True)
+
+    # Plugins draw from world.rng(); Python's RNG is only used by the renderer.
     random.seed(seed)
 
-    print('  [------] Generating Voronoi points for world...')
-    points = point_cloud(PointCount)
-    vor = voronoi.generate(points)
+    prof = profiler.activate( profiler.Profiler() )
 
-    cell_idxs = [idx for idx in range(PointCount)]
-    cell_mapping = {}
-    for cell_idx, v_idx in enumerate( sorted(vor.point_region) ):
-        cell_mapping[cell_idx] = v_idx
+    # Don't leave the profiler active if generating fails; batch workers go on to the next world.
+    try:
+        (w, vd) = build_world(PointCount, seed)
 
-    print('  [------] Building world graph...')
-    worldgraph = graph.BuildGraph(cell_idxs, vor, cell_mapping)
+        # Generate the world
+        print('  [{}] Generating world #{}...'.format(w.id, world_idx + 1))
+        plugin_cache = cache.PluginCache(cache_folder) if cache_folder is not None else None
+        generate_world(w, vd, workers=plugin_workers, plugin_cache=plugin_cache)
 
-    w = world.World(cell_idxs, vor, worldgraph)
-    vd = voronoi.VoronoiDiagram(vor, cell_mapping)
-    
-    # Generate the world
-    print('  [{}] Generating world #{}...'.format(w.id, world_idx + 1))
-    generate_world(w, vd)
+        ## Render one or more images
+        print('  [{}] Rendering world...'.format(w.id))
 
-    ## Render one or more images
-    print('  [{}] Rendering world...'.format(w.id))
+        render_opts = renderer.RenderOptions()
+        render_opts.filename = os.path.join(folder, 'world.png')
 
-    folder = 'gallery/%s' % (str(datetime.datetime.now()),)
-    os.mkdir(folder)
+        print('   * Rendering png ({})...'.format(render_opts.filename))
+        renderer.print_render(w, vd, render_opts)
+    finally:
+        profiler.deactivate()
 
-    render_opts = renderer.RenderOptions()
-    render_opts.filename = 'sample.png'
-    # render_opts.filename = 'batch/{}.png'.format(w.id)
+    w.save(folder, metadata={ 'point_count': PointCount })
 
-    print('   * Rendering png ({})...'.format(render_opts.filename))
-    renderer.print_render(w, vd, render_opts)
+    if ProfileOutput:
+        prof.save_json(os.path.join(folder, 'profile.json'))
+        prof.save_trace(os.path.join(folder, 'trace.json'))
 
     # print_render_opts = renderer.RenderOptions()
     # print_render_opts.filename = 'print.svg'
@@ -117,13 +122,64 @@ def generate(world_idx):
     # print('    * Rendering svg...')
     # renderer.print_render(w, vd, print_render_opts)
 
-if __name__ == '__main__':
-    if len(sys.argv) > 1:
-        NumWorlds = int(sys.argv[1])
+    return folder
+
+def world_seeds(base_seed, num_worlds):
+    '''
+    Derive statistically independent seeds for each world in a batch from a single base seed.
+    '''
+    children = numpy.random.SeedSequence(base_seed).spawn(num_worlds)
+
+    return [int(child.generate_state(1, dtype=numpy.uint64)[0]) for child in children]
+
+def generate_task(task):
+    (world_idx, seed, output_folder, plugin_workers, cache_folder, force) = task
 
-    print('num_worlds={}, num_points={}'.format(NumWorlds, PointCount))
+    return generate(world_idx, seed, output_folder, plugin_workers, cache_folder, force)
+
+def generate_batch(num_worlds, base_seed, output_folder=OutputFolder, workers=1, cache_folder=None, force=False):
+    '''
+    Generate `num_worlds` worlds across `workers` processes. Worker processes are reused
+    for all of the worlds they generate, so imports and other startup costs are only paid once
+    per worker. Each world is written to `<output_folder>/batch-<base_seed>/<idx>-<seed>`.
+
+    Every world in a batch has its own seed, so the plugin cache only helps when re-running a
+    batch with the same base seed; it's off unless `cache_folder` is set. Worlds that were
+    already written to `output_folder` are skipped unless `force` is set.
+    '''
+    batch_folder = os.path.join(output_folder, 'batch-%d' % (base_seed,))
+    os.makedirs(batch_folder, exist_ok=True)
+
+    # Processes already keep every core busy; running plugins on threads as well just adds contention.
+    plugin_workers = PluginWorkers if workers <= 1 else 1
+
+    tasks = [
+        (world_idx, seed, batch_folder, plugin_workers, cache_folder, force)
+        for world_idx, seed in enumerate( world_seeds(base_seed, num_worlds) )
+    ]
+
+    if workers <= 1:
+        return [generate_task(task) for task in tasks]
+
+    with multiprocessing.Pool(processes=workers) as pool:
+        return list( pool.imap_unordered(generate_task, tasks) )
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Generate and render one or more worlds.')
+    parser.add_argument('num_worlds', nargs='?', type=int, default=NumWorlds)
+    parser.add_argument('--workers', type=int, default=1, help='number of worlds to generate in parallel')
+    parser.add_argument('--seed', type=int, help='base seed for the batch; defaults to the current time')
+    parser.add_argument('--out', default=OutputFolder, help='folder to write worlds to')
+    parser.add_argument('--force', action='store_true', help='regenerate and overwrite worlds that already exist in the output folder')
+    parser.add_argument('--cache', action='store_true', help='reuse plugin outputs cached by previous runs with the same seed (kept in %s)' % (CacheFolder,))
+    args = parser.parse_args()
+
+    base_seed = args.seed
+    if base_seed is None:
+        base_seed = round( datetime.datetime.now().timestamp() * 10000 )
+
+    print('num_worlds={}, num_points={}, workers={}, seed={}'.format(args.num_worlds, PointCount, args.workers, base_seed))
     print('')
 
     print('Generating world(s)...')
-    for idx in range(NumWorlds):
-        generate(idx)
\ No newline at end of file
+    generate_batch(args.num_worlds, base_seed, args.out, args.workers, CacheFolder if args.cache else None, args.force)
@@ -1,7 +1,5 @@
 #!/bin/bash
 
-for i in $(seq $1)
-do
-	python3 gen.py
-	sleep 2
-done
\ No newline at end of file
+# Usage: ./gen.sh <num_worlds> [workers]
+# Generates worlds in parallel, one warm worker process per core by default.
+python3 gen.py $1 --workers ${2:-$(nproc)}
@@ -1,141 +1,550 @@
-import collections, igraph
-import errors
+import collections, copy, itertools, numpy, scipy.sparse, scipy.sparse.csgraph
+import errors, profiler, voronoi
+
+try:
+    import numba
+except ImportError:
+    numba = None
+
+# Run breadth-first searches with the compiled kernel when numba is installed.
+UseNumba = True
+
+# Upper bound on (sources x nodes) visited flags held at once by Graph.rings_many().
+RingsMaxVisited = 2 ** 24
 
 class Graph(object):
-    def __init__(self, edges):
-        self.ig = igraph.Graph()
+    '''
+    Undirected graph over region idxs. Adjacency is stored in CSR form: the neighbors of node
+    `i` are `indices[indptr[i]:indptr[i + 1]]`, in ascending order.
+
+    Searches run a whole BFS level at a time over numpy arrays (or in a compiled kernel, see
+    `UseNumba`). Wherever a search takes a predicate over nodes it also accepts a boolean mask
+    with one entry per node, which is much faster than calling a function for every node.
+
+    Subgraphs made from a node mask are views: they share the CSR arrays of the graph they
+    came from and only store the mask. An edge is part of a view iff both of its nodes are in
+    the mask.
+    '''
+
+    def __init__(self, edges, node_count=None):
+        '''
+        Build a graph from a list of (src, dest) pairs or an equivalent (k, 2) array. Nodes are
+        numbered from zero up to the highest idx in `edges`, or up to `node_count - 1` if it's
+        given.
+        '''
+        self._edges = numpy.asarray(edges, dtype=numpy.int32).reshape(-1, 2)
+
+        if node_count is None:
+            node_count = self._edges.max() + 1 if len(self._edges) > 0 else 0
 
-        # Count number of vertices
-        region_idxs = set()
-        for (src, dest) in edges:
-            region_idxs.add(src)
-            region_idxs.add(dest)
+        src = numpy.concatenate(( self._edges[:, 0], self._edges[:, 1] ))
+        dest = numpy.concatenate(( self._edges[:, 1], self._edges[:, 0] ))
+        order = numpy.lexsort((dest, src))
 
-        if len(region_idxs) == 0:
-            return
+        self.indices = dest[order]
+        self.indptr = numpy.zeros(int(node_count) + 1, dtype=numpy.int32)
+        numpy.cumsum(numpy.bincount(src, minlength=int(node_count)), out=self.indptr[1:])
 
-        self.ig.add_vertices(max(region_idxs) + 1)
-        self.ig.add_edges(edges)
+        # Nodes included in this graph; None for all of them. Set on views made by subgraph().
+        self.mask = None
 
     def subgraph(self, edge_filter):
-        edges = filter(edge_filter, self.edges())
+        '''
+        Returns a graph with the same nodes and a subset of the edges. `edge_filter` is either
+        a boolean mask of nodes or a function that's called with each (src, dest) edge.
+
+        A mask is much cheaper: the result is a view that shares this graph's arrays and keeps
+        an edge iff both of its nodes are in the mask. A function requires building a new graph.
+        '''
+        if callable(edge_filter):
+            return Graph( list( filter(edge_filter, self.edges()) ), node_count=self.node_count() )
 
-        return Graph( list(edges) )
+        view = copy.copy(self)
+        view.mask = self._with_mask(edge_filter)
+
+        return view
+
+    def _with_mask(self, mask):
+        '''
+        Combine a node mask with this graph's own mask. Returns None if neither exists.
+        '''
+        if mask is None:
+            return self.mask
+
+        mask = numpy.asarray(mask, dtype=bool)
+
+        return mask if self.mask is None else mask & self.mask
+
+    def _edge_array(self):
+        if self.mask is None:
+            return self._edges
+
+        return self._edges[ self.mask[self._edges[:, 0]] & self.mask[self._edges[:, 1]] ]
 
     def node_count(self):
         '''
         Return the number of nodes in the graph. This may be one (1) higher than expected
         because of how we build the graph.
         '''
-        return self.ig.vcount()
+        return len(self.indptr) - 1
 
     def edge_count(self):
         '''
         Return the number of edges in the graph.
         '''
-        return self.ig.ecount()
+        return len( self._edge_array() )
 
     def nodes(self):
         '''
-        Return a list containing all region_idxs represented in the graph. A node will only
-        exist in the graph if there's at least one inbound or outbound edge.
+        Return a list containing all region_idxs represented in the graph: 0..node_count()-1,
+        one per row of the CSR `indptr` array. Nodes without any edges are included and
+        simply have an empty slice of `indices`.
         '''
-        return self.ig.vs.indices
+        return list( range(self.node_count()) )
 
     def edges(self):
         '''
         Generator that iterates over all edges in the graph.
         '''
-        for edge in self.ig.get_edgelist():
-            yield edge
+        for edge in self._edge_array().tolist():
+            yield tuple(edge)
+
+    def expand(self, frontier):
+        '''
+        Returns the neighbors of every node in `frontier`, concatenated. Nodes appear once for
+        each frontier node they're adjacent to.
+        '''
+        frontier = numpy.asarray(frontier, dtype=numpy.int32)
+
+        if self.mask is None:
+            return expand(self.indptr, self.indices, frontier)
+
+        neighbors = expand(self.indptr, self.indices, frontier[ self.mask[frontier] ])
+
+        return neighbors[ self.mask[neighbors] ]
+
+    def distances(self, sources, mask=None, max_distance=None):
+        '''
+        Multi-source BFS. Returns an int32 array with the number of steps from each node to the
+        closest source, or -1 for nodes that can't be reached within `max_distance` steps.
+
+        `sources` is a list of node idxs or a boolean mask. If `mask` is given, the search only
+        passes through nodes in the mask; sources are always at distance zero.
+        '''
+        sources = numpy.asarray(sources)
+        if sources.dtype == bool:
+            sources = numpy.flatnonzero(sources)
+
+        if mask is None:
+            mask = numpy.ones(self.node_count(), dtype=bool)
+
+        return self.distance_field(sources, max_distance, mask)[0]
+
+    def distance_field(self, sources, max_distance=None, mask=None):
+        '''
+        Distance from every node to the closest of many sources, from a single BFS. Returns
+        (dist, nearest): int32 arrays with the number of steps to the closest source and that
+        source's idx, or -1 for nodes that can't be reached within `max_distance` steps. If
+        several sources are equally close, `nearest` holds one of them.
+
+        `sources` is a boolean mask (i.e. `world.cp_celltype == Cell.Type.WATER`) or a list
+        of node idxs. If `mask` is given, the search only passes through nodes in the mask.
+        Sources outside of the mask are at distance zero but don't lead anywhere.
+        '''
+        profiler.count('graph.distance_field')
+
+        sources = numpy.asarray(sources)
+        if sources.dtype == bool:
+            sources = numpy.flatnonzero(sources)
+
+        mask = self._with_mask(mask)
+        if mask is None:
+            mask = numpy.ones(self.node_count(), dtype=bool)
+
+        bfs = bfs_numba if numba is not None and UseNumba else bfs_numpy
+
+        return bfs(
+            self.indptr,
+            self.indices,
+            sources.astype(numpy.int32),
+            numpy.asarray(mask, dtype=bool),
+            -1 if max_distance is None else int(max_distance),
+        )
 
     def all_within(self, region_idx, radius):
-        idxs = set()
+        '''
+        Returns all nodes that are at least one and less than `radius` steps from `region_idx`.
+        '''
+        if region_idx >= self.node_count() or radius < 2:
+            return []
+
+        (offsets, nodes) = self.rings(region_idx, radius - 1)
+
+        return numpy.sort( nodes[ offsets[1]:offsets[-1] ] ).tolist()
 
-        for dist in range(1, radius):
-            nodes = self.neighbors(region_idx, dist)
+    def rings(self, region_idx, radius):
+        '''
+        All rings around `region_idx` out to `radius` steps, from a single BFS. Returns
+        (offsets, nodes): the nodes exactly `d` steps away are `nodes[offsets[d]:offsets[d + 1]]`
+        in ascending order, for 0 <= d <= radius.
+        '''
+        (offsets, nodes) = self.rings_many([region_idx,], radius)
+
+        return (offsets[0], nodes)
+
+    def rings_many(self, sources, radius):
+        '''
+        Batched rings(): answers the query for every node in `sources` at once, each with its
+        own independent BFS. Returns (offsets, nodes) where `offsets` has one row per source,
+        i.e. the nodes exactly `d` steps from `sources[i]` are `nodes[offsets[i, d]:offsets[i, d + 1]]`.
+        '''
+        sources = numpy.asarray(sources, dtype=numpy.int64)
+        mask = self._with_mask(None)
+        if mask is None:
+            mask = numpy.ones(self.node_count(), dtype=bool)
 
-            idxs.update(nodes)
-        
-        return list(idxs)
+        # Each BFS gets its own row of visited flags; split very large batches to bound memory.
+        chunk_size = max(1, RingsMaxVisited // max(1, self.node_count()))
+
+        all_offsets = []
+        all_nodes = []
+        start = 0
+
+        for chunk_start in range(0, len(sources), chunk_size):
+            (offsets, nodes) = rings_numpy(self.indptr, self.indices, sources[chunk_start:chunk_start + chunk_size], mask, radius)
+
+            all_offsets.append(offsets + start)
+            all_nodes.append(nodes)
+            start += len(nodes)
+
+        if len(all_offsets) == 0:
+            return (numpy.zeros((0, radius + 2), dtype=numpy.int64), numpy.zeros(0, dtype=numpy.int32))
+
+        return (numpy.concatenate(all_offsets), numpy.concatenate(all_nodes))
 
     def neighbors(self, region_idx, dist=1):
         '''
         Find all neighbors @ distance `dist` for the specified node.
         '''
+        profiler.count('graph.neighbors')
+
         if region_idx >= self.node_count():
             return []
 
-        neighbors = []
+        if dist == 1:
+            neighbors = self.indices[ self.indptr[region_idx]:self.indptr[region_idx + 1] ]
+
+            if self.mask is not None:
+                neighbors = neighbors[ self.mask[neighbors] ] if self.mask[region_idx] else neighbors[:0]
+
+            return neighbors.tolist()
+
+        (offsets, nodes) = self.rings(region_idx, dist)
 
-        for (vertex, vert_dist, _) in self.ig.bfsiter(int(region_idx), advanced=True):
-            if vert_dist == dist:
-                neighbors.append(vertex.index)
-            
-            if vert_dist > dist:
-                return neighbors
-        
-        return neighbors
+        return nodes[ offsets[dist]:offsets[dist + 1] ].tolist()
 
-    def distance(self, region_idx, dest_func, max_distance=None):
+    def distance(self, region_idx, dest, max_distance=None):
         '''
-        Find path from region_idx to a node that satisfies `dest_func`, traveling
-        only through nodes that satisfy `traverse_func`. Return the destination idx
-        as well as the shortest distance from `region_idx` to the destination.
+        Find the closest node to `region_idx` that satisfies `dest`, which is either a boolean
+        mask of nodes or a function that's called with node idxs. Return the destination idx
+        as well as the shortest distance from `region_idx` to the destination. If several
+        destinations are equally close, the lowest idx wins.
 
         The returned `dist` is guaranteed to be the shortest distance.
         '''
+        profiler.count('graph.distance')
 
         # region_idx doesn't exist in the graph
         if region_idx >= self.node_count():
             return (None, 0)
 
-        for (vertex, vert_dist, _) in self.ig.bfsiter(int(region_idx), advanced=True):
-            if dest_func(vertex.index):
-                return (vertex.index, vert_dist)
-            
-            if max_distance and vert_dist > max_distance:
+        if callable(dest):
+            matches = lambda frontier: [idx for idx in frontier.tolist() if dest(idx)]
+        else:
+            dest = numpy.asarray(dest, dtype=bool)
+            matches = lambda frontier: frontier[ dest[frontier] ]
+
+        visited = numpy.zeros(self.node_count(), dtype=bool)
+        visited[region_idx] = True
+
+        frontier = numpy.array([region_idx,], dtype=numpy.int32)
+        level = 0
+
+        while len(frontier) > 0:
+            found = matches(frontier)
+
+            if len(found) > 0:
+                return (int(found[0]), level)
+
+            if max_distance and level >= max_distance:
                 return (None, max_distance)
-        
+
+            candidates = self.expand(frontier)
+            frontier = numpy.unique( candidates[ ~visited[candidates] ] )
+            visited[frontier] = True
+
+            level += 1
+
         return (None, max_distance)
 
-    def floodfill(self, region_idx):
+    def components(self, mask=None):
         '''
-        Expand in all directions from `region_idx` as long as new cells satisfy
-        the `fill_func`.
+        Label the connected components of the graph in one pass. Only nodes in `mask` (and
+        this graph's own mask, for views) are included. Returns (labels, sizes): an int32
+        label for every node, numbered from zero in order of each component's lowest node idx
+        (-1 for excluded nodes), and the number of nodes in each component.
         '''
+        profiler.count('graph.components')
+
+        mask = self._with_mask(mask)
+        if mask is None:
+            mask = numpy.ones(self.node_count(), dtype=bool)
+
+        # Drop every edge that touches an excluded node
+        rows = numpy.repeat( numpy.arange(self.node_count(), dtype=numpy.int32), numpy.diff(self.indptr) )
+        keep = mask[rows] & mask[self.indices]
+
+        indptr = numpy.zeros_like(self.indptr)
+        numpy.cumsum(numpy.bincount(rows[keep], minlength=self.node_count()), out=indptr[1:])
+
+        adjacency = scipy.sparse.csr_matrix(
+            (numpy.ones(keep.sum(), dtype=numpy.int8), self.indices[keep], indptr),
+            shape=(self.node_count(), self.node_count()),
+        )
+
+        (_, labels) = scipy.sparse.csgraph.connected_components(adjacency, directed=False)
+
+        # scipy numbers components by their lowest node; renumber without the excluded nodes.
+        (_, included, sizes) = numpy.unique(labels[mask], return_inverse=True, return_counts=True)
+
+        labels = numpy.full(self.node_count(), -1, dtype=numpy.int32)
+        labels[mask] = included
+
+        return (labels, sizes)
+
+    def floodfill(self, region_idx, mask=None):
+        '''
+        Expand in all directions from `region_idx`, only entering nodes in `mask` if it's given.
+        Returns all nodes reached, including `region_idx`.
+        '''
+        profiler.count('graph.floodfill')
 
         if region_idx >= self.node_count():
             return []
 
-        return [ v.index for v in self.ig.bfsiter(int(region_idx)) ]
+        return numpy.flatnonzero( self.distances([region_idx,], mask=mask) != -1 ).tolist()
 
-def BuildGraph(cell_idxs, vor, mapping):
+def component_members(labels):
     '''
-    Build a graph connecting cells that share vertices.
+    Returns a list with the node idxs in each component, given the labels from
+    Graph.components().
     '''
-    edges = []
+    order = numpy.argsort(labels, kind='stable')
+    order = order[ labels[order] != -1 ]
+
+    (_, starts) = numpy.unique(labels[order], return_index=True)
+
+    return numpy.split(order, starts[1:]) if len(order) > 0 else []
+
+def component_centroids(labels, xs, ys):
+    '''
+    Returns a (k, 2) array with the mean (x, y) position of each component's nodes, given the
+    labels from Graph.components() and the position of every node.
+    '''
+    included = labels != -1
+    count = labels.max() + 1 if numpy.any(included) else 0
+    sizes = numpy.bincount(labels[included], minlength=count)
+
+    return numpy.column_stack((
+        numpy.bincount(labels[included], weights=numpy.asarray(xs)[included], minlength=count) / sizes,
+        numpy.bincount(labels[included], weights=numpy.asarray(ys)[included], minlength=count) / sizes,
+    ))
+
+def rings_numpy(indptr, indices, sources, mask, radius):
+    '''
+    Level-synchronous BFS from each source independently, out to `radius` steps. Each
+    (source, node) pair is tracked as the key `source_pos * node_count + node`. Returns
+    (offsets, nodes) as described in Graph.rings_many().
+    '''
+    node_count = len(indptr) - 1
+    visited = numpy.zeros(len(sources) * node_count, dtype=bool)
+
+    keys = numpy.arange(len(sources), dtype=numpy.int64) * node_count + sources
+    visited[keys] = True
+    levels = [keys,]
+
+    for _ in range(radius):
+        (owners, frontier) = numpy.divmod(keys, node_count)
+
+        # Only nodes in the mask lead anywhere
+        expandable = mask[frontier]
+        (owners, frontier) = (owners[expandable], frontier[expandable])
+
+        neighbors = expand(indptr, indices, frontier)
+        candidates = numpy.repeat(owners, indptr[frontier + 1] - indptr[frontier]) * node_count + neighbors
+        candidates = candidates[ mask[neighbors] & ~visited[candidates] ]
+
+        keys = numpy.unique(candidates)
+        visited[keys] = True
+        levels.append(keys)
+
+    keys = numpy.concatenate(levels)
+    dist = numpy.repeat( numpy.arange(radius + 1), [len(level) for level in levels] )
+    (owners, nodes) = numpy.divmod(keys, node_count)
+
+    # Group by source, then by distance. Keys in each level are sorted, so nodes stay in order.
+    group = owners * (radius + 1) + dist
+    order = numpy.argsort(group, kind='stable')
+
+    flat_offsets = numpy.zeros(len(sources) * (radius + 1) + 1, dtype=numpy.int64)
+    numpy.cumsum(numpy.bincount(group, minlength=len(sources) * (radius + 1)), out=flat_offsets[1:])
+
+    rows = numpy.arange(len(sources))[:, numpy.newaxis] * (radius + 1) + numpy.arange(radius + 2)
+
+    return (flat_offsets[rows], nodes[order].astype(numpy.int32))
+
+def expand(indptr, indices, frontier):
+    '''
+    Gather the CSR adjacency lists of all `frontier` nodes into one array.
+    '''
+    starts = indptr[frontier]
+    counts = indptr[frontier + 1] - starts
+
+    # Position of each output entry within its own adjacency list
+    within = numpy.arange(counts.sum()) - numpy.repeat(numpy.cumsum(counts) - counts, counts)
+
+    return indices[ numpy.repeat(starts, counts) + within ]
+
+def bfs_numpy(indptr, indices, sources, mask, max_distance):
+    '''
+    Level-synchronous BFS: each step expands the entire frontier with array operations.
+    Returns the distance to every node and the source it was reached from (both -1 if
+    unreached). Only nodes in `mask` are entered or expanded. Pass -1 for an unlimited
+    `max_distance`.
+    '''
+    dist = numpy.full(len(indptr) - 1, -1, dtype=numpy.int32)
+    nearest = numpy.full(len(indptr) - 1, -1, dtype=numpy.int32)
+
+    frontier = numpy.unique(sources)
+    dist[frontier] = 0
+    nearest[frontier] = frontier
+    level = 0
+
+    while len(frontier) > 0 and (max_distance < 0 or level < max_distance):
+        level += 1
+
+        frontier = frontier[ mask[frontier] ]
+
+        candidates = expand(indptr, indices, frontier)
+        origins = numpy.repeat( nearest[frontier], indptr[frontier + 1] - indptr[frontier] )
+
+        keep = (dist[candidates] == -1) & mask[candidates]
+        (frontier, first) = numpy.unique(candidates[keep], return_index=True)
+
+        dist[frontier] = level
+        nearest[frontier] = origins[keep][first]
+
+    return (dist, nearest)
+
+if numba is not None:
+    @numba.njit(cache=True)
+    def bfs_numba(indptr, indices, sources, mask, max_distance):
+        '''
+        Queue-based BFS with the same inputs and distances as bfs_numpy(). Ties between equally
+        close sources may be broken differently.
+        '''
+        dist = numpy.full(len(indptr) - 1, -1, dtype=numpy.int32)
+        nearest = numpy.full(len(indptr) - 1, -1, dtype=numpy.int32)
+        queue = numpy.empty(len(indptr) - 1, dtype=numpy.int32)
+        (head, tail) = (0, 0)
+
+        for source in sources:
+            if dist[source] == -1:
+                dist[source] = 0
+                nearest[source] = source
+                queue[tail] = source
+                tail += 1
+
+        while head < tail:
+            node = queue[head]
+            head += 1
+
+            if not mask[node] or (max_distance >= 0 and dist[node] >= max_distance):
+                continue
+
+            for neighbor in indices[ indptr[node]:indptr[node + 1] ]:
+                if dist[neighbor] == -1 and mask[neighbor]:
+                    dist[neighbor] = dist[node] + 1
+                    nearest[neighbor] = nearest[node]
+                    queue[tail] = neighbor
+                    tail += 1
+
+        return (dist, nearest)
+
+def BuildGraph(cell_idxs, vor, mapping, adjacency='ridge'):
+    '''
+    Build a graph connecting neighboring cells. Each pair of neighbors is connected by a single
+    undirected edge. `adjacency` decides which cells are neighbors:
+
+    - 'ridge': cells that share a ridge (true Voronoi adjacency)
+    - 'vertex': cells that share at least one vertex; this also connects cells that only touch
+      at a corner, which only happens when four or more sites are cocircular.
+    '''
+    cell_idxs = numpy.asarray(cell_idxs, dtype=numpy.intp)
+    mapping = voronoi.CellMapping.of(vor, mapping)
+
+    if adjacency == 'ridge':
+        edges = ridge_adjacency(cell_idxs, vor, mapping)
+    elif adjacency == 'vertex':
+        edges = vertex_adjacency(cell_idxs, vor, mapping)
+    else:
+        raise ValueError('Unknown adjacency: %s' % (adjacency,))
+
+    # Store each edge once, with the lower cell idx first.
+    edges = numpy.unique( numpy.sort(edges, axis=1), axis=0 )
+
+    return Graph(edges, node_count=cell_idxs.max() + 1 if len(cell_idxs) > 0 else 0)
+
+def ridge_adjacency(cell_idxs, vor, mapping):
+    '''
+    Returns a (k, 2) array of cells separated by a ridge. Ridges next to points that
+    aren't cells (i.e. reflections outside of a bounded diagram) are skipped.
+    '''
+    point_cell = numpy.full(len(vor.points), -1, dtype=numpy.intp)
+    point_cell[ mapping.cell_point[cell_idxs] ] = cell_idxs
+
+    ridge_cells = point_cell[vor.ridge_points]
+
+    return ridge_cells[ numpy.all(ridge_cells != -1, axis=1) ]
+
+def vertex_adjacency(cell_idxs, vor, mapping):
+    '''
+    Returns a (k, 2) array of cells that share a vertex.
+    '''
+    regions = [vor.regions[region_idx] for region_idx in mapping.cell_region[cell_idxs].tolist()]
+    lengths = numpy.fromiter( map(len, regions), dtype=numpy.intp, count=len(regions) )
+
+    vertices = numpy.fromiter( itertools.chain.from_iterable(regions), dtype=numpy.intp, count=lengths.sum() )
+    owners = numpy.repeat(cell_idxs, lengths)
 
-    # map vertex_id => region_idx that touch vertex
-    regions_by_vertex = {}
+    keep = vertices != -1
+    order = numpy.lexsort((owners[keep], vertices[keep]))
+    (vertices, owners) = (vertices[keep][order], owners[keep][order])
 
-    # List all regions that share each vertex
-    for cell_idx in cell_idxs:
-        v_idx = mapping[cell_idx]
+    # Cells sharing a vertex are now next to each other; pair each cell with every other cell
+    # in its run, `offset` positions ahead.
+    pairs = []
+    offset = 1
+    while offset < len(vertices):
+        same_vertex = vertices[offset:] == vertices[:-offset]
 
-        for vertex in vor.regions[v_idx]:
-            if vertex not in regions_by_vertex:
-                regions_by_vertex[vertex] = []
+        if not numpy.any(same_vertex):
+            break
 
-            regions_by_vertex[vertex].append(cell_idx)
+        pairs.append( numpy.column_stack((owners[:-offset][same_vertex], owners[offset:][same_vertex])) )
+        offset += 1
 
-    # Run through list of vertices and build edges between all connected regions
-    for (_, cell_idxs) in regions_by_vertex.items():
-        for source in cell_idxs:
-            for dest in cell_idxs:
-                if source != dest:
-                    # print('%d -> %d' % (source, dest))
-                    edges.append( (source, dest) )
-                    edges.append( (dest, source) )
+    if len(pairs) == 0:
+        return numpy.empty((0, 2), dtype=numpy.intp)
 
-    return Graph(edges)
\ No newline at end of file
+    return numpy.concatenate(pairs)
@@ -1,7 +1,27 @@
+import collections
 from xmlrpc.client import ServerProxy
 
 ServerHost = 'localhost'
 ServerPort = 8050
 
+# Set to True to generate placeholder names without a running language server (i.e. benchmarks).
+UseStub = False
+
+class StubClient(object):
+    '''
+    Offline stand-in for the language server. Names are deterministic placeholders that
+    include the entity type and a running count.
+    '''
+    def __init__(self):
+        self.counts = collections.Counter()
+
+    def get_name(self, language, entity_type, params):
+        self.counts[entity_type] += 1
+
+        return '%s %s %d' % (language.title(), entity_type.title(), self.counts[entity_type])
+
 def GetClient():
-    return ServerProxy('http://%s:%d' % (ServerHost, ServerPort))
\ No newline at end of file
+    if UseStub:
+        return StubClient()
+
+    return ServerProxy('http://%s:%d' % (ServerHost, ServerPort))
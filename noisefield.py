@@ -0,0 +1,189 @@
+'''
+Simplex noise evaluated on whole arrays of coordinates at once. This is a port of the `noise`
+package's snoise2() (without tiling) that does its math in float32 just like the C version, so
+it produces the same values.
+'''
+import collections, threading, numpy
+
+# One layer of a weighted noise field: fractal noise with `octaves` octaves at `scale`.
+NoiseWeight = collections.namedtuple('NoiseWeight', ['weight', 'scale', 'octaves'])
+
+# 2D simplex skew factors
+F2 = numpy.float32(0.3660254037844386)   # 0.5 * (sqrt(3.0) - 1.0)
+G2 = numpy.float32(0.21132486540518713)  # (3.0 - sqrt(3.0)) / 6.0
+
+# Gradient directions; 2D noise only uses the x and y components.
+GRAD3 = numpy.array([
+    [1, 1, 0], [-1, 1, 0], [1, -1, 0], [-1, -1, 0],
+    [1, 0, 1], [-1, 0, 1], [1, 0, -1], [-1, 0, -1],
+    [0, 1, 1], [0, -1, 1], [0, 1, -1], [0, -1, -1],
+], dtype=numpy.float32)
+
+# Permutation table, repeated twice so lookups can skip wrapping.
+PERM = numpy.tile( numpy.array([
+    151, 160, 137, 91, 90, 15, 131, 13, 201, 95, 96, 53, 194, 233, 7, 225,
+    140, 36, 103, 30, 69, 142, 8, 99, 37, 240, 21, 10, 23, 190, 6, 148,
+    247, 120, 234, 75, 0, 26, 197, 62, 94, 252, 219, 203, 117, 35, 11, 32,
+    57, 177, 33, 88, 237, 149, 56, 87, 174, 20, 125, 136, 171, 168, 68, 175,
+    74, 165, 71, 134, 139, 48, 27, 166, 77, 146, 158, 231, 83, 111, 229, 122,
+    60, 211, 133, 230, 220, 105, 92, 41, 55, 46, 245, 40, 244, 102, 143, 54,
+    65, 25, 63, 161, 1, 216, 80, 73, 209, 76, 132, 187, 208, 89, 18, 169,
+    200, 196, 135, 130, 116, 188, 159, 86, 164, 100, 109, 198, 173, 186, 3, 64,
+    52, 217, 226, 250, 124, 123, 5, 202, 38, 147, 118, 126, 255, 82, 85, 212,
+    207, 206, 59, 227, 47, 16, 58, 17, 182, 189, 28, 42, 223, 183, 170, 213,
+    119, 248, 152, 2, 44, 154, 163, 70, 221, 153, 101, 155, 167, 43, 172, 9,
+    129, 22, 39, 253, 19, 98, 108, 110, 79, 113, 224, 232, 178, 185, 112, 104,
+    218, 246, 97, 228, 251, 34, 242, 193, 238, 210, 144, 12, 191, 179, 162, 241,
+    81, 51, 145, 235, 249, 14, 239, 107, 49, 192, 214, 31, 181, 199, 106, 157,
+    184, 84, 204, 176, 115, 121, 50, 45, 127, 4, 150, 254, 138, 236, 205, 93,
+    222, 114, 67, 29, 24, 72, 243, 141, 128, 195, 78, 66, 215, 61, 156, 180,
+], dtype=numpy.int32), 2 )
+
+def noise2(x, y):
+    '''
+    Single-octave simplex noise for float32 arrays `x` and `y`, in [-1, 1].
+    '''
+    one = numpy.float32(1.0)
+
+    s = (x + y) * F2
+    i = numpy.floor(x + s)
+    j = numpy.floor(y + s)
+    t = (i + j) * G2
+
+    x0 = x - (i - t)
+    y0 = y - (j - t)
+
+    # Which of the two triangles in the skewed cell the point is in.
+    i1 = (x0 > y0).astype(numpy.float32)
+    j1 = one - i1
+
+    corners = (
+        (x0, y0),
+        (x0 - i1 + G2, y0 - j1 + G2),
+        (x0 + G2 * numpy.float32(2.0) - one, y0 + G2 * numpy.float32(2.0) - one),
+    )
+
+    I = i.astype(numpy.int64) & 255
+    J = j.astype(numpy.int64) & 255
+    (i1, j1) = (i1.astype(numpy.int64), j1.astype(numpy.int64))
+
+    gradients = (
+        PERM[ I + PERM[J] ] % 12,
+        PERM[ I + i1 + PERM[J + j1] ] % 12,
+        PERM[ I + 1 + PERM[J + 1] ] % 12,
+    )
+
+    total = None
+    for (xx, yy), g in zip(corners, gradients):
+        f = numpy.float32(0.5) - xx * xx - yy * yy
+        contrib = numpy.where(f > 0, f * f * f * f * (GRAD3[g, 0] * xx + GRAD3[g, 1] * yy), numpy.float32(0.0))
+
+        total = contrib if total is None else total + contrib
+
+    return total * numpy.float32(70.0)
+
+def snoise2(x, y, octaves=1, persistence=0.5, lacunarity=2.0, base=0.0):
+    '''
+    Fractal (fBm) simplex noise at every (x, y), with the same arguments as `noise.snoise2`.
+    Returns an array of doubles shaped like `x`.
+    '''
+    x = numpy.asarray(x, dtype=numpy.float32)
+    y = numpy.asarray(y, dtype=numpy.float32)
+
+    persistence = numpy.float32(persistence)
+    lacunarity = numpy.float32(lacunarity)
+    base = numpy.float32(base)
+
+    freq = numpy.float32(1.0)
+    amp = numpy.float32(1.0)
+    max_amp = numpy.float32(1.0)
+    total = noise2(x + base, y + base)
+
+    for _ in range(1, octaves):
+        freq *= lacunarity
+        amp *= persistence
+        max_amp += amp
+        total += noise2(x * freq + base, y * freq + base) * amp
+
+    return (total / max_amp).astype(numpy.double)
+
+class NoiseField(object):
+    '''
+    Noise over a fixed set of (x, y) coordinates, i.e. the center of every cell or every pixel
+    of a raster. Each octave is a single simplex layer at some frequency; layers are cached by
+    (base, frequency), so fields whose scales overlap (like scale 4 and scale 8 with the
+    default lacunarity of 2) only evaluate the shared layers once.
+
+    Results match snoise2() exactly when the lacunarity is a power of two.
+    '''
+
+    def __init__(self, x, y):
+        self.x = numpy.asarray(x, dtype=numpy.double)
+        self.y = numpy.asarray(y, dtype=numpy.double)
+
+        self._layers = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def raster(width, height):
+        '''
+        A field over the centers of the pixels of a `width` x `height` raster covering the unit
+        square. Values come back flat and can be reshaped to (height, width).
+        '''
+        (y, x) = numpy.mgrid[0:height, 0:width]
+
+        return NoiseField( ((x + 0.5) / width).ravel(), ((y + 0.5) / height).ravel() )
+
+    def layer(self, freq, base):
+        '''
+        A single octave of noise at `freq`, offset by `base`. Layers are shared and read-only.
+        '''
+        key = (float(base), float(freq))
+
+        with self._lock:
+            value = self._layers.get(key)
+
+        if value is None:
+            base = numpy.float32(base)
+            value = noise2(
+                numpy.asarray(self.x * freq, dtype=numpy.float32) + base,
+                numpy.asarray(self.y * freq, dtype=numpy.float32) + base,
+            )
+            value.flags.writeable = False
+
+            with self._lock:
+                value = self._layers.setdefault(key, value)
+
+        return value
+
+    def fbm(self, scale, octaves=1, base=0.0, persistence=0.5, lacunarity=2.0):
+        '''
+        Same as `snoise2(x * scale, y * scale, octaves, persistence, lacunarity, base)`.
+        '''
+        persistence = numpy.float32(persistence)
+
+        amp = numpy.float32(1.0)
+        max_amp = numpy.float32(1.0)
+        total = self.layer(scale, base).copy()
+
+        for octave in range(1, octaves):
+            amp *= persistence
+            max_amp += amp
+            total += self.layer(scale * lacunarity ** octave, base) * amp
+
+        return (total / max_amp).astype(numpy.double)
+
+    def weighted(self, weights, base):
+        '''
+        Weighted average of several fbm() fields, each described by a NoiseWeight and shifted
+        from [-1, 1] to [0, 1].
+        '''
+        all_weights = sum( [nw.weight for nw in weights] )
+
+        total = 0.0
+        for nw in weights:
+            weight = nw.weight / all_weights
+
+            total += weight * ( 0.5 * (self.fbm(nw.scale, nw.octaves, base) + 1.0) )
+
+        return total
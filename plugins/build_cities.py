@@ -1,4 +1,4 @@
-import random, numpy, math
+import numpy, math
 
 from scipy.spatial.kdtree import distance_matrix
 
@@ -10,7 +10,10 @@ from cultures.human import HumanCulture
 class City(Entity):
     MaxSize = 5
 
-    def __init__(self, cell_idx, culture, world):
+    def __init__(self, cell_idx, culture, world, water_dist):
+        '''
+        `water_dist` is the distance field to water; see Graph.distance_field().
+        '''
         super().__init__(None)
         self.cell_idx = cell_idx
         self.culture = culture
@@ -20,10 +23,10 @@ class City(Entity):
 
         # Determine whether the city is near water for naming purposes; certain names are for
         # seafaring cities only!
-        (_, distance) = world.graph.distance(cell_idx, lambda idx: world.cp_celltype[idx] == Cell.Type.WATER, 3)
+        distance = water_dist[cell_idx]
 
         self.fetch_name(culture.lang, 'city', {
-            'near_water': distance < 3,
+            'near_water': distance != -1 and distance < 3,
         })
 
     def size(self):
@@ -68,6 +71,8 @@ class City(Entity):
 
 @genreq(cellprops=['elevation', 'celltype', 'biome'])
 def generate(world, vd):
+    rng = world.rng(__name__)
+
     SampleSize = 6
     GrowthIterations = 10
 
@@ -92,6 +97,7 @@ def generate(world, vd):
         return len( list( filter(lambda c: c.culture == culture, cities) ) )
 
     land_cells = numpy.argwhere(world.cp_celltype == Cell.Type.LAND)[:, 0]
+    (water_dist, _) = world.distance_field('celltype', Cell.Type.WATER, max_distance=3)
 
     active_cultures = [True for _ in cultures]
 
@@ -99,7 +105,7 @@ def generate(world, vd):
     while sum(active_cultures) > 0:
         for culture_idx, (culture, min_score) in enumerate(cultures):
             if active_cultures[culture_idx]:
-                samples = random.choices(land_cells, k=SampleSize)
+                samples = list( rng.choice(land_cells, size=SampleSize) )
                 scores = list( map(lambda idx: score(idx, culture), samples) )
 
                 # If at least one cell is above the threshold, settle. If not, this
@@ -108,7 +114,7 @@ def generate(world, vd):
                     top_cell_idx = samples[scores.index(max(scores))]
 
                     # Add city to the world
-                    city = City(top_cell_idx, culture, world)
+                    city = City(top_cell_idx, culture, world, water_dist)
 
                     cities.append(city)
                     world.add_entity(city)
@@ -117,16 +123,22 @@ def generate(world, vd):
     
     # Simulate growth of cities
     city_region = {}
-    for city in cities:
-        city_region[city.cell_idx] = world.graph.all_within(city.cell_idx, 10)
+    city_dist = {}
+
+    # Every cell within 9 steps of each city, from one batched BFS.
+    (offsets, ring_idxs) = world.graph.rings_many([city.cell_idx for city in cities], 9)
+
+    for i, city in enumerate(cities):
+        city_region[city.cell_idx] = numpy.sort( ring_idxs[ offsets[i, 1]:offsets[i, -1] ] ).tolist()
+        city_dist[city.cell_idx] = world.graph.distances([city.cell_idx,])
 
-        city.population = random.randint(10, 100)
+        city.population = int( rng.integers(10, 100, endpoint=True) )
 
     for _ in range(GrowthIterations):
         for city in cities:
             culture = city.culture
             # Randomly choose 10 nearby cells to measure the benefits of the terrain to the colonizing culture.
-            nearby_idxs = random.choices(city_region[city.cell_idx], k=10)
+            nearby_idxs = rng.choice(city_region[city.cell_idx], size=10)
 
             # Calculate the average carrying capacity of the sampled cells
             carry_cap = sum( map(lambda idx: culture.carrying_capacity(idx), nearby_idxs) ) / len(nearby_idxs)
@@ -139,7 +151,7 @@ def generate(world, vd):
             for dest in cities:
                 d_desirability = max(culture.desirability(dest) - culture.desirability(city), 0.0)
 
-                (_, dist) = world.graph.distance(city.cell_idx, lambda idx: idx == dest.cell_idx)
+                dist = city_dist[city.cell_idx][dest.cell_idx]
                 distance = dist / 100  # normalize based on map size (pct of map)
 
                 pct_migrate = d_desirability * distance
@@ -1,12 +1,14 @@
-import random, numpy, math
+import numpy, math
 
 from world import Cell
 from decorators import genreq
 
-@genreq(cellprops=['celltype', 'latitude'], worldparams=['has_lakes'])
+@genreq(cellprops=['celltype', 'latitude', 'elevation'], worldparams=['has_lakes'], produces=['temperature'])
 def generate(world, vd):
-    min_temperature = random.random() / 5.0         # [0.0, 0.2]
-    max_temperature = 1 - (random.random() / 5.0)   # [0.8, 1.0]
+    rng = world.rng(__name__)
+
+    min_temperature = rng.random() / 5.0         # [0.0, 0.2]
+    max_temperature = 1 - (rng.random() / 5.0)   # [0.8, 1.0]
     
     def gen_temperature(latitude, elevation):
         base = math.sin(latitude * math.pi) * (max_temperature - min_temperature) + min_temperature
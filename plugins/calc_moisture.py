@@ -1,60 +1,125 @@
-import random, numpy, collections
+import numpy, math
 
-from world import Cell
+import graph
+from world import Cell, World
 from decorators import genreq
-from noise import snoise2
+from noisefield import NoiseWeight
 
 NoiseConfig = {
     'scale': 3.0,           # top tweak
     'octaves': 6,
     'persistence': 1.35,    # amplitude multiplier
     'lacunarity': 1.5,      # frequency multiplier
-    'base': random.randint(0, 1000)
 }
 
-NoiseWeight = collections.namedtuple('NoiseWeight', ['weight', 'scale', 'octaves'])
 noise_weights = [
     NoiseWeight(weight=0.8, scale=2, octaves=4),
     NoiseWeight(weight=0.2, scale=4, octaves=8),
     NoiseWeight(weight=0.1, scale=8, octaves=16)
 ]
-noise_base = random.randint(0, 1000)
 
-def noise_xy(x, y):
-    all_weights = sum( [nw.weight for nw in noise_weights] )
+# Moisture added to cells by their distance to water: 0 (water itself), 1, 2 and 3 steps away.
+WaterBonus = (0.25, 0.2, 0.12, 0.04)
 
-    total = 0.0
-    for nw in noise_weights:
-        weight = nw.weight / all_weights
+# Carry moisture from the water along a prevailing wind. Air picks up moisture over water and
+# rains it out over land, much faster over mountains, which leaves dry rain shadows behind them.
+WindAdvection = True
+AdvectionWeight = 0.5       # share of the final moisture that comes from the wind
+LandRetention = 0.9         # share of its moisture the air keeps after crossing a land cell...
+MountainRetention = 0.4     # ...or a mountain cell (both at standard density)
+OpenAirHumidity = 0.5       # moisture of air blowing in from the edge of the world
 
-        # Shift noise from [-1, 1] to [0, 1]
-        base = 0.5 * (snoise2(x * nw.scale, y * nw.scale, nw.octaves, base=noise_base) + 1.0)
+def water_bonus(world):
+    '''
+    The WaterBonus for every cell. Cells closer to water have higher moisture levels.
+    "Moisture" refers to rainfall, not just the existance of water.
+    '''
+    # Distance from every cell to the closest water; only the first few steps matter.
+    (water_dist, _) = world.distance_field('celltype', Cell.Type.WATER, max_distance=len(WaterBonus) - 1)
 
-        total += (weight * base)
+    bonus = numpy.zeros(len(WaterBonus) + 1)
+    bonus[:-1] = WaterBonus     # water_dist of -1 (farther than 3 steps) picks the trailing 0.0
 
-    return total
+    return bonus[water_dist]
 
-@genreq(cellprops=['celltype', 'latitude', 'longitude'], worldparams=['has_lakes'])
+def advect(world, wind_angle):
+    '''
+    Sweep moisture across the world graph in the direction of the wind. Each cell's neighbors
+    are split into upwind and downwind by their position along the wind (ties broken by cell idx),
+    which makes the graph a DAG. Cells are visited in topological order one wavefront at a time:
+    a cell is ready once all of its upwind neighbors are, and the air reaching it is the mean of
+    what they pass on.
+
+    The number of Python iterations grows with the longest downwind path (roughly the square
+    root of the cell count) rather than with the number of cells, which is what keeps this fast
+    without a compiled per-cell sweep.
+
+    Returns the moisture of the air arriving at every cell; water cells are always 1.0.
+    '''
+    cell_count = world.get_cellcount()
+    (indptr, indices) = (world.graph.indptr, world.graph.indices)
+
+    position = world.cp_longitude * math.cos(wind_angle) + world.cp_latitude * math.sin(wind_angle)
+    rank = numpy.empty(cell_count, dtype=numpy.int64)
+    rank[ numpy.argsort(position, kind='stable') ] = numpy.arange(cell_count)
+
+    # Keep only the downwind direction of every edge; CSR order is preserved.
+    owners = numpy.repeat( numpy.arange(cell_count), numpy.diff(indptr) )
+    downwind = rank[owners] < rank[indices]
+
+    down_indptr = numpy.zeros(cell_count + 1, dtype=numpy.int64)
+    numpy.cumsum( numpy.bincount(owners[downwind], minlength=cell_count), out=down_indptr[1:] )
+    down_indices = indices[downwind]
+
+    upwind_count = numpy.bincount(down_indices, minlength=cell_count)
+
+    # More cells means more (smaller) steps to cross the same distance.
+    steps = math.sqrt(cell_count / World.StandardDensityCellCount)
+    retention = numpy.where(
+        world.cp_elevation >= world.get_param('MountainMinHeight'),
+        MountainRetention ** (1.0 / steps),
+        LandRetention ** (1.0 / steps),
+    )
+    is_water = world.cp_celltype == Cell.Type.WATER
+
+    incoming = numpy.zeros(cell_count)
+    waiting = upwind_count.copy()
+    arriving = numpy.full(cell_count, numpy.nan)     # stays NaN for cells the sweep never reaches
+    passed_on = numpy.zeros(cell_count)
+
+    frontier = numpy.flatnonzero(upwind_count == 0)
+
+    while len(frontier) > 0:
+        from_upwind = upwind_count[frontier]
+        arriving[frontier] = numpy.where(
+            is_water[frontier], 
+            1.0, 
+            numpy.where(from_upwind > 0, incoming[frontier] / numpy.maximum(from_upwind, 1), OpenAirHumidity),
+        )
+        passed_on[frontier] = numpy.where(is_water[frontier], 1.0, arriving[frontier] * retention[frontier])
+
+        neighbors = graph.expand(down_indptr, down_indices, frontier)
+        senders = numpy.repeat(frontier, down_indptr[frontier + 1] - down_indptr[frontier])
+
+        numpy.add.at(incoming, neighbors, passed_on[senders])
+        numpy.subtract.at(waiting, neighbors, 1)
+
+        frontier = numpy.unique( neighbors[ waiting[neighbors] == 0 ] )
+
+    return arriving
+
+@genreq(cellprops=['celltype', 'latitude', 'longitude', 'elevation'], worldparams=['has_lakes', 'MountainMinHeight'], produces=['moisture'])
 def generate(world, vd):
+    rng = world.rng(__name__)
+    noise_base = int( rng.integers(0, 1000, endpoint=True) )
+
+    noise = world.noise().weighted(noise_weights, noise_base)
+
+    moisture_arr = noise + water_bonus(world)
+
+    if WindAdvection:
+        wind_angle = rng.random() * 2 * math.pi
+        moisture_arr = (1.0 - AdvectionWeight) * moisture_arr + AdvectionWeight * advect(world, wind_angle)
 
-    def calculate_cell_moisture(idx):
-        base = noise_xy(world.cp_longitude[idx], world.cp_latitude[idx])
-
-        (_, dist_water) = world.graph.distance(idx, lambda dest_idx: world.cp_celltype[dest_idx] == Cell.Type.WATER)
-
-        # Cells closer to water have higher moisture levels. 
-        # "Moisture" refers to rainfall, not just the existance of water.
-        if world.cp_celltype[idx] == Cell.Type.WATER:
-            base += 0.25
-        elif dist_water == 1:
-            base += 0.2
-        elif dist_water == 2:
-            base += 0.12
-        elif dist_water == 3:
-            base += 0.04
-        
-        return max(0.0, min(0.99, base))
-
-    moisture_list = [calculate_cell_moisture(idx) for idx in world.cell_idxs()]
-    moisture_arr = world.new_cp_array(numpy.double, moisture_list)
-    world.add_cell_property('moisture', moisture_arr)
\ No newline at end of file
+    moisture_arr = numpy.clip(moisture_arr, 0.0, 0.99)
+    world.add_cell_property('moisture', moisture_arr)
@@ -1,27 +1,23 @@
-import numpy, random
+import numpy
 
 from decorators import genreq
 from world import Cell
 
-NumForests = random.randint(2, 5)
 SampleSize = 10
 ScoreThresholdMultiplier = 0.8
 
-@genreq(cellprops=['celltype', 'elevation', 'biome'], worldparams=['has_lakes'])
+@genreq(cellprops=['celltype', 'elevation', 'biome'], worldparams=['has_lakes'], produces=['forest_id'])
 def generate(world, vd):
     '''
     Generate a series of forests across the map.
     '''
+    rng = world.rng(__name__)
+
+    NumForests = int( rng.integers(2, 5, endpoint=True) )
     
     forest_arr = world.new_cp_array(numpy.int8, -1)
     
-    def valid_forest_cells(edge):
-        (src, dest) = edge
-
-        return world.cp_celltype[src] == Cell.Type.LAND and \
-            world.cp_celltype[dest] == Cell.Type.LAND
-
-    landgraph = world.graph.subgraph(valid_forest_cells)
+    landgraph = world.subgraph('celltype', Cell.Type.LAND)
 
     # Relative weights of each biome's ability to support a forest.
     biome_score = (0, 10, 0, 25, 25, 0, 0, 40)
@@ -46,7 +42,7 @@ def generate(world, vd):
         # Choose from all unassigned land cells.
         land_cells = numpy.argwhere((forest_arr == -1) & (world.cp_celltype == Cell.Type.LAND))[:, 0]
         
-        samples = random.choices(land_cells, k=SampleSize)
+        samples = list( rng.choice(land_cells, size=SampleSize) )
         scores = [score(idx) for idx in samples]
 
         top_cell_idx = samples[scores.index(max(scores))]
@@ -54,11 +50,14 @@ def generate(world, vd):
 
         forest = set([top_cell_idx,])
 
-        for dist in range(1, random.randint(5, 10)):
+        max_dist = int( rng.integers(5, 10, endpoint=True) )
+        (offsets, ring_idxs) = landgraph.rings(top_cell_idx, max_dist - 1)
+
+        for dist in range(1, max_dist):
             expanded = [ 
                 idx 
-                for idx in landgraph.neighbors(top_cell_idx, dist=dist) 
-                if score(idx) > threshold and random.random() > 0.10 * dist
+                for idx in ring_idxs[ offsets[dist]:offsets[dist + 1] ].tolist()
+                if score(idx) > threshold and rng.random() > 0.10 * dist
             ]
 
             forest.update(expanded)
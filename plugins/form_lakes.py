@@ -3,7 +3,7 @@ import numpy, functools, math
 from decorators import genreq
 from world import Cell
 
-@genreq(cellprops=['celltype', 'elevation', 'depth'])
+@genreq(cellprops=['celltype', 'elevation', 'depth'], produces=['has_lakes'], mutates=['celltype', 'depth'])
 def generate(world, vd):
     '''
     Create lakes in low 'bowls' where water runs downhill and doesn't have a way to get out to an
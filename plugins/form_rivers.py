@@ -62,6 +62,10 @@ def generate(world, vd):
     for vertex_id in edgegraph.nodes():
         included_cells = vd.included_cells(vertex_id)
 
+        # Corners of mirrored regions outside of the world
+        if len(included_cells) == 0:
+            continue
+
         # Elevation is the average of all included cells
         edge_elevation[vertex_id] = sum( [world.cp_elevation[cell_idx] for cell_idx in included_cells] ) / len(included_cells)
         edge_celltype[vertex_id] = Cell.Type.WATER if Cell.Type.WATER in [world.cp_celltype[idx] for idx in included_cells] else Cell.Type.LAND
@@ -105,21 +109,15 @@ def generate(world, vd):
             flow(idx)
     
     rivergraph = Graph([pair for pair, flow_rate in edges.items() if flow_rate > MinFlowThreshold])
-    all_rivers = set()
-
-    for idx in rivergraph.nodes():
-        if idx not in all_rivers:
-            river_set = rivergraph.floodfill(idx)
 
-            water_cells = [idx for idx in river_set if edge_celltype[idx] == Cell.Type.WATER]
+    # Each connected group of vertices is a river; it needs to be long enough and reach water.
+    (labels, sizes) = rivergraph.components()
 
-            def single_river(edge):
-                return edge[0] in river_set and edge[1] in river_set
+    is_water = numpy.array([celltype == Cell.Type.WATER for celltype in edge_celltype[:rivergraph.node_count()]], dtype=bool)
+    water_vertices = numpy.bincount(labels, weights=is_water, minlength=len(sizes))
 
-            if len(river_set) >= MinRiverLength and len(water_cells) > 0:
-                r = River( rivergraph.subgraph(single_river), edges )
+    for label in numpy.flatnonzero((sizes >= MinRiverLength) & (water_vertices > 0)):
+        r = River( rivergraph.subgraph(labels == label), edges )
 
-                # Add the river to the world
-                world.add_entity(r)
-                # Remove these cells from consideration for future rivers
-                all_rivers.update(river_set)
\ No newline at end of file
+        # Add the river to the world
+        world.add_entity(r)
\ No newline at end of file
@@ -1,6 +1,6 @@
-import random, numpy, collections
+import numpy
 
-from noise import snoise2
+from noisefield import NoiseWeight
 
 from world import Cell
 from decorators import genreq
@@ -19,9 +19,9 @@ from decorators import genreq
 
 #     return ( snoise2(scaled_x, scaled_y, octaves=octaves, persistence=persistence, lacunarity=lacunarity, base=base) + 1.0) / 2.0
 
-def randfloat(low, high):
+def randfloat(rng, low, high):
     diff = high - low
-    return (random.random() * diff) + low
+    return (rng.random() * diff) + low
 
 # def cap(val, low, high):
 #     if val < low:
@@ -43,7 +43,6 @@ def randfloat(low, high):
 #     return 0.0
 
 #########
-NoiseWeight = collections.namedtuple('NoiseWeight', ['weight', 'scale', 'octaves'])
 noise_weights = [
     NoiseWeight(weight=0.8, scale=3, octaves=4),
     NoiseWeight(weight=0.2, scale=4, octaves=8),
@@ -51,68 +50,37 @@ noise_weights = [
 ]
 
 shift_weight = NoiseWeight(weight=0.6, scale=None, octaves=None)
-noise_base = random.randint(0, 1000)
 
 def calc_shift(x, y):
-	x_dist = min(x, 1.0 - x)
-	y_dist = min(y, 1.0 - y)
+    '''
+    How far into the border band around the edge of the world each (x, y) is: 0 outside of
+    the band, rising to 1 at the edge. Works on arrays.
+    '''
+    smaller = numpy.minimum( numpy.minimum(x, 1.0 - x), numpy.minimum(y, 1.0 - y) )
 
-	smaller = min(x_dist, y_dist)
+    return numpy.maximum(0.15 - smaller, 0.0) / 0.15
 
-	if smaller < 0.15:
-		return (0.15 - smaller) / 0.15
-	
-	return 0.0
-
-def noise_xy(x, y):
-    all_weights = sum( [nw.weight for nw in noise_weights] )
-
-    total = 0.0
-    for nw in noise_weights:
-        weight = nw.weight / all_weights
-
-        # Shift noise from [-1, 1] to [0, 1]
-        base = 0.5 * (snoise2(x * nw.scale, y * nw.scale, nw.octaves, base=noise_base) + 1.0)
-
-        total += (weight * base)
-
-    return total
-
-@genreq(cellprops=['latitude', 'longitude', 'plate'])
+@genreq(cellprops=['latitude', 'longitude', 'plate'], produces=['elevation', 'celltype', 'depth', 'WaterlineHeight'])
 def generate(world, vd):
-    elevation_list = []
-
-    for idx in world.cell_idxs():
-        longitude = world.cp_longitude[idx]
-        latitude = world.cp_latitude[idx]
+    rng = world.rng(__name__)
+    noise_base = int( rng.integers(0, 1000, endpoint=True) )
 
-        base = noise_xy(longitude, latitude)
-        shift = calc_shift(longitude, latitude) * shift_weight.weight
+    base = world.noise().weighted(noise_weights, noise_base)
+    shift = calc_shift(world.cp_longitude, world.cp_latitude) * shift_weight.weight
 
-        elevation_list.append( max(0.01, min(0.99, base - shift)) )
-
-    elevation_arr = world.new_cp_array(numpy.double, elevation_list)
+    elevation_arr = numpy.clip(base - shift, 0.01, 0.99)
     world.add_cell_property('elevation', elevation_arr)
 
-    WaterlineHeight = randfloat(0.35, 0.6)
+    WaterlineHeight = randfloat(rng, 0.35, 0.6)
 
-    def celltype(elevation):
-        return Cell.Type.LAND if elevation > WaterlineHeight else Cell.Type.WATER
+    is_land = elevation_arr > WaterlineHeight
 
-    celltype_list = [celltype(world.cp_elevation[idx]) for idx in world.cell_idxs()]
-    celltype_arr = world.new_cp_array(None, celltype_list)
+    celltype_arr = numpy.where(is_land, Cell.Type.LAND, Cell.Type.WATER)
 
     world.add_cell_property('celltype', celltype_arr)
     world.set_param('WaterlineHeight', WaterlineHeight)
 
-    depth_list = []
-    for idx in world.cell_idxs():
-        if world.cp_celltype[idx] == Cell.Type.WATER:
-            depth_list.append( WaterlineHeight - world.cp_elevation[idx] )
-        else:
-            depth_list.append(0.0)
-    
-    depth_arr = world.new_cp_array(numpy.double, depth_list)
+    depth_arr = numpy.where(is_land, 0.0, WaterlineHeight - elevation_arr)
     world.add_cell_property('depth', depth_arr)
 
 
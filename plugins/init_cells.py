@@ -2,7 +2,7 @@ import numpy
 
 from decorators import genreq
 
-@genreq(cellprops=[])
+@genreq(cellprops=[], produces=['voronoi_idx', 'latitude', 'longitude', 'MountainMinHeight'])
 def generate(world, vd):
     '''
     Mark boundary cells and assign latitude/longitude to each cell from Voronoi diagram.
@@ -11,24 +11,15 @@ def generate(world, vd):
     cell's `boundary` property to properly reflect whether they're a boundary cell.
     '''
 
+    mapping = vd.mapping
+
     # Store the voronoi region idx for the cell.
-    v_idxs = sorted(vd.vor.point_region)
-    voronoi_idx = world.new_cp_array(numpy.uint32, v_idxs)
+    voronoi_idx = mapping.cell_region.astype(numpy.uint32)
 
     world.add_cell_property('voronoi_idx', voronoi_idx)
 
-    # Add latitude and longitude from the Voronoi diagram
-    latitude_arr = numpy.full(world.get_cellcount(), -1, dtype=numpy.double)
-    longitude_arr = numpy.full(world.get_cellcount(), -1, dtype=numpy.double)
-
-    for point_idx, v_idx in enumerate(vd.vor.point_region):
-        # Get the cell idx for the voronoi region idx
-        # TODO: check performance implications; this is O(N^2) and may be slow
-        cell_idx = v_idxs.index(v_idx)
-
-        # Longitude = x axis, latitude = y axis
-        longitude_arr[cell_idx] = vd.vor.points[point_idx][0]
-        latitude_arr[cell_idx] = vd.vor.points[point_idx][1]
+    # Add latitude and longitude from the Voronoi diagram. Longitude = x axis, latitude = y axis
+    (longitude_arr, latitude_arr) = numpy.array(vd.vor.points[mapping.cell_point].T, dtype=numpy.double)
 
     world.add_cell_property('latitude', latitude_arr)
     world.add_cell_property('longitude', longitude_arr)
@@ -28,7 +28,7 @@ def GetBiome(biome_id=None, name=None):
     if name:
         return [b for b in biomes if b.name == name][0]
 
-@genreq(cellprops=['temperature', 'moisture'])
+@genreq(cellprops=['temperature', 'moisture'], produces=['biome'])
 def generate(world, vd):
 
     def identify_biome(idx):
@@ -1,10 +1,10 @@
-import numpy, random
+import numpy
 
 from decorators import genreq
 
-@genreq(cellprops=[])
+@genreq(cellprops=[], produces=['plate', 'InitialPlateSplitProb', 'InitialContinentMin', 'InitialContinentMax'])
 def generate(world, vd):
-    # return
+    rng = world.rng(__name__)
 
     Unassigned = -1
 
@@ -14,42 +14,76 @@ def generate(world, vd):
     # Configuration
     LandformConfig = {
         'InitialPlateSplitProb': 0.05,
-        'InitialContinentMin': random.randint(4, 8),
-        'InitialContinentMax': random.randint(8, 12),
+        'InitialContinentMin': int( rng.integers(4, 8, endpoint=True) ),
+        'InitialContinentMax': int( rng.integers(8, 12, endpoint=True) ),
     }
 
     world.set_param('InitialPlateSplitProb', LandformConfig['InitialPlateSplitProb'])
     world.set_param('InitialContinentMin', LandformConfig['InitialContinentMin'])
     world.set_param('InitialContinentMax', LandformConfig['InitialContinentMax'])
 
-    num_plates = random.randint(
+    num_plates = int( rng.integers(
         LandformConfig['InitialContinentMin'], 
         LandformConfig['InitialContinentMax'], 
-    )
+        endpoint=True,
+    ) )
 
-    plate_centers = random.choices( list(world.cell_idxs()), k=num_plates )
+    plate_centers = list( rng.choice( list(world.cell_idxs()), size=num_plates ) )
     plate_dist = [1,] * num_plates      # distance to go out from the center to find available cells
 
-    unlabeled = set(world.cell_idxs())  # all cells start off as unlabeled
+    unlabeled = world.new_cp_array(bool, True)  # all cells start off as unlabeled
+    remaining = world.get_cellcount()
 
     for plate_idx, region_idx in enumerate(plate_centers):
         plates_arr[region_idx] = plate_idx
-        unlabeled.discard(region_idx)
+
+        if unlabeled[region_idx]:
+            unlabeled[region_idx] = False
+            remaining -= 1
 
     graph = world.graph
 
+    # Rings around each plate center, computed out to `ring_radius[center_idx]` and
+    # extended (for all plates that need it at once) when a plate grows past that.
+    rings = {}
+    ring_radius = {}
+
+    def extend(center_idxs, radius):
+        (offsets, nodes) = graph.rings_many(center_idxs, radius)
+
+        for i, center_idx in enumerate(center_idxs):
+            rings[center_idx] = (offsets[i] - offsets[i][0], nodes[ offsets[i][0]:offsets[i][-1] ])
+            ring_radius[center_idx] = radius
+
+    def ring(center_idx, dist):
+        if ring_radius[center_idx] < dist:
+            extend([center_idx,], 2 * dist)
+
+        (offsets, nodes) = rings[center_idx]
+        ring_idxs = nodes[ offsets[dist]:offsets[dist + 1] ]
+
+        return ring_idxs[ unlabeled[ring_idxs] ]
+
     # Add all cells to a plate
-    while len(unlabeled) > 0:
+    while remaining > 0:
+        stale = [
+            center_idx for center_idx in plate_centers
+            if ring_radius.get(center_idx, 0) < plate_dist[ plates_arr[center_idx] ] + 1
+        ]
+
+        if len(stale) > 0:
+            extend(stale, 2 * max( [plate_dist[ plates_arr[center_idx] ] + 1 for center_idx in stale] ))
+
         # For each plate, expand out from the center
         for center_idx in plate_centers:
             plate_id = plates_arr[center_idx]
 
-            avail = list( filter(lambda idx: idx in unlabeled, graph.neighbors(center_idx, plate_dist[plate_id])) )
+            avail = ring(center_idx, plate_dist[plate_id])
 
             # If there are no neighbors in the current radius, try expanding once. If there's nothing there
             # if means we're surrounded and should skip from here on out.
             if len(avail) == 0:
-                avail = list( filter(lambda idx: idx in unlabeled, graph.neighbors(center_idx, plate_dist[plate_id] + 1)) )
+                avail = ring(center_idx, plate_dist[plate_id] + 1)
 
                 # If there are neighbors to mark, continue. If not, move on to the next plate.
                 if len(avail) > 0:
@@ -58,27 +92,28 @@ def generate(world, vd):
                     continue
 
             # The selected cells becomes part of the plate
-            for idx in avail:
-                plates_arr[idx] = plates_arr[center_idx]
-                unlabeled.discard(idx)
+            plates_arr[avail] = plates_arr[center_idx]
+            unlabeled[avail] = False
+            remaining -= len(avail)
 
             # Count remaining cells to be marked; break the loop if we're done.
-            if len(unlabeled) == 0:
+            if remaining == 0:
                 break
 
         # There's a chance to add a new plate each iteration. New plates
         # can only exist in unmarked cells.
-        if random.random() < LandformConfig['InitialPlateSplitProb']:
+        if rng.random() < LandformConfig['InitialPlateSplitProb']:
             # avail = list( filter(lambda idx: idx in unlabeled, world.cell_idxs()) )
 
-            if len(unlabeled) > 0:
-                cell_idx = random.choice(list(unlabeled))
+            if remaining > 0:
+                cell_idx = rng.choice( numpy.flatnonzero(unlabeled) )
 
                 # Reserve a new plate_id                
                 plates_arr[cell_idx] = len(plate_centers)
                 plate_centers.append(cell_idx)      # add to plate centers so it joins the core rotation
                 plate_dist.append(1)                # all plates start at dist=1
-                unlabeled.discard(cell_idx)         # cell_idx no longer available for labeling
+                unlabeled[cell_idx] = False         # cell_idx no longer available for labeling
+                remaining -= 1
 
     # Add cp_plate to the world
     world.add_cell_property('plate', plates_arr)
\ No newline at end of file
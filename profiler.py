@@ -0,0 +1,159 @@
+'''
+Lightweight instrumentation for world generation. A Profiler records a Stage for each plugin
+run or render step, including wall time, CPU time, the change in peak RSS and counts of expensive
+operations (graph searches, name lookups) that happened while the stage was active.
+
+Only one profiler is active at a time; instrumented code calls the module-level `count()`,
+`stage()`, `begin()` and `end()` functions, which do nothing if no profiler is active.
+'''
+
+import collections, contextlib, json, os, resource, threading, time
+
+class Stage(object):
+    def __init__(self, name, category, origin):
+        self.name = name
+        self.category = category
+        self.thread_id = threading.get_ident()
+        self.counters = collections.Counter()
+
+        self.start = time.perf_counter() - origin
+        self.wall_ms = 0.0
+        self.cpu_ms = 0.0
+        self.rss_delta_kb = 0
+
+        self._wall_start = time.perf_counter()
+        self._cpu_start = time.thread_time()
+        self._rss_start = Stage.peak_rss()
+
+    def finish(self):
+        self.wall_ms = (time.perf_counter() - self._wall_start) * 1000
+        self.cpu_ms = (time.thread_time() - self._cpu_start) * 1000
+        self.rss_delta_kb = Stage.peak_rss() - self._rss_start
+
+    @staticmethod
+    def peak_rss():
+        '''
+        Peak resident set size of the process, in kilobytes.
+        '''
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    def to_dict(self):
+        return {
+            'name': self.name,
+            'category': self.category,
+            'start_ms': round(self.start * 1000, 3),
+            'wall_ms': round(self.wall_ms, 3),
+            'cpu_ms': round(self.cpu_ms, 3),
+            'peak_rss_delta_kb': self.rss_delta_kb,
+            'counters': dict(self.counters),
+        }
+
+class Profiler(object):
+    def __init__(self):
+        self.stages = []
+        self.origin = time.perf_counter()
+
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def _stack(self):
+        if not hasattr(self._local, 'stack'):
+            self._local.stack = []
+
+        return self._local.stack
+
+    def begin(self, name, category):
+        stage = Stage(name, category, self.origin)
+        self._stack().append(stage)
+
+        return stage
+
+    def end(self):
+        stage = self._stack().pop()
+        stage.finish()
+
+        with self._lock:
+            self.stages.append(stage)
+
+        return stage
+
+    @contextlib.contextmanager
+    def stage(self, name, category):
+        self.begin(name, category)
+
+        try:
+            yield
+        finally:
+            self.end()
+
+    def count(self, counter, n=1):
+        '''
+        Attribute `n` occurrences of `counter` to the innermost stage running on this thread.
+        '''
+        stack = self._stack()
+
+        if len(stack) > 0:
+            stack[-1].counters[counter] += n
+
+    def to_json(self):
+        return [stage.to_dict() for stage in sorted(self.stages, key=lambda s: s.start)]
+
+    def save_json(self, filename):
+        with open(filename, 'w') as fp:
+            json.dump(self.to_json(), fp, indent=2)
+
+    def save_trace(self, filename):
+        '''
+        Write stages in the Chrome trace-event format; load the file in chrome://tracing or
+        https://ui.perfetto.dev to see a timeline.
+        '''
+        events = []
+
+        for stage in self.stages:
+            events.append({
+                'name': stage.name,
+                'cat': stage.category,
+                'ph': 'X',
+                'ts': stage.start * 1000000,
+                'dur': stage.wall_ms * 1000,
+                'pid': os.getpid(),
+                'tid': stage.thread_id,
+                'args': {
+                    'cpu_ms': round(stage.cpu_ms, 3),
+                    'peak_rss_delta_kb': stage.rss_delta_kb,
+                    **stage.counters,
+                },
+            })
+
+        with open(filename, 'w') as fp:
+            json.dump({ 'traceEvents': events, 'displayTimeUnit': 'ms' }, fp)
+
+active = None
+
+def activate(profiler):
+    global active
+    active = profiler
+
+    return profiler
+
+def deactivate():
+    global active
+    active = None
+
+def count(counter, n=1):
+    if active is not None:
+        active.count(counter, n)
+
+def begin(name, category):
+    if active is not None:
+        active.begin(name, category)
+
+def end():
+    if active is not None:
+        active.end()
+
+def stage(name, category):
+    if active is not None:
+        return active.stage(name, category)
+
+    return contextlib.nullcontext()
@@ -2,6 +2,7 @@ from renderer.hill import draw_hill
 from renderer.mountain import draw_mountain
 
 import enum, cairo, colour, math, random, numpy, random
+import profiler
 from plugins.identify_poi import PointOfInterest
 
 # import xml.etree.ElementTree as ET
@@ -26,6 +27,12 @@ class RenderOptions(object):
 def transform(point):
     return (point[0], 1.0 - point[1])
 
+def transform_points(points):
+    '''
+    Same as transform() for an (n, 2) array of points.
+    '''
+    return points * (1.0, -1.0) + (0.0, 1.0)
+
 def rgba(r, g, b, a=1.0):
     return (r / 255.0, g / 255.0, b / 255.0, a)
 
@@ -326,12 +333,14 @@ def add_water_shading(ctx, world, vd, theme):
 
     ctx.stroke()
 
+    (land_dist, _) = world.distance_field('celltype', Cell.Type.LAND)
+
     for cell_idx in numpy.argwhere(world.cp_celltype == Cell.Type.WATER)[:, 0]:
         # All cells beyond a configured radius get cleared
-        (_, dist) = world.graph.distance(cell_idx, lambda idx: world.cp_celltype[idx] == Cell.Type.LAND)
+        dist = land_dist[cell_idx]
 
-        if dist > world.std_density(1.2):
-            region = list( map(lambda pt: transform(pt), vd.get_region(cell_idx)) )
+        if dist == -1 or dist > world.std_density(1.2):
+            region = transform_points( vd.get_region(cell_idx) )
 
             draw_region(ctx, region, theme.WaterOcean)
 
@@ -368,166 +377,166 @@ def print_render(world, vd, opts):
         ctx.fill()
 
         print('   * [1 / X] Adding water shading...')
-        add_water_shading(ctx, world, vd, theme)
+        with profiler.stage('Adding water shading', 'render'):
+            add_water_shading(ctx, world, vd, theme)
 
         cell_colors = {} # idx => color
 
         # Draw landforms, including lakes
         print('   * [2 / X] Drawing landforms...')
-        for landform_id in [id for id in numpy.unique(world.cp_landform_id) if id != -1]:
-            # Get all cells with the current landform_id
-            cell_idxs = numpy.argwhere(world.cp_landform_id == landform_id)[:, 0]
+        with profiler.stage('Drawing landforms', 'render'):
+            landform_ridges = vd.boundary_ridges_by_label(world.cp_landform_id)
 
-            for polygon in vd.outline_polygons(cell_idxs):
-                outline_x = []
-                outline_y = []
+            for landform_id in [id for id in numpy.unique(world.cp_landform_id) if id != -1]:
+                # Get all cells with the current landform_id
+                cell_idxs = numpy.argwhere(world.cp_landform_id == landform_id)[:, 0]
 
-                for segment in polygon:
-                    outline_x.append(segment[0][0])
-                    outline_y.append(segment[0][1])
+                for ring in vd.outline_rings(cell_idxs, landform_ridges[landform_id]):
+                    # Close the ring
+                    outline_x = numpy.append(ring.coords[:, 0], ring.coords[0, 0])
+                    outline_y = numpy.append(ring.coords[:, 1], ring.coords[0, 1])
 
-                outline_x.append(outline_x[0])
-                outline_y.append(outline_y[0])
+                    _, outline_x = inter(outline_x)
+                    _, outline_y = inter(outline_y)
 
-                _, outline_x = inter(outline_x)
-                _, outline_y = inter(outline_y)
+                    render_landform(ctx, outline_x, outline_y)
 
-                render_landform(ctx, outline_x, outline_y)
+                # Render background
+                ctx.set_source_rgba(1, 1, 1, 1)
+                ctx.set_fill_rule(cairo.FILL_RULE_EVEN_ODD)
+                landform_path = ctx.copy_path()
+                ctx.fill_preserve()
 
-            # Render background
-            ctx.set_source_rgba(1, 1, 1, 1)
-            ctx.set_fill_rule(cairo.FILL_RULE_EVEN_ODD)
-            landform_path = ctx.copy_path()
-            ctx.fill_preserve()
+                # Render elevation shading
+                ctx.save()
+                ctx.clip()
 
-            # Render elevation shading
-            ctx.save()
-            ctx.clip()
+                color_sealevel = colour.Color('#fff')
+                color_peak = colour.Color('#aaa')
+                num_colors = 10
+                gradient = theme.add_alpha( list( map(lambda c: c.rgb, color_sealevel.range_to(color_peak, num_colors)) ) )                
 
-            color_sealevel = colour.Color('#fff')
-            color_peak = colour.Color('#aaa')
-            num_colors = 10
-            gradient = theme.add_alpha( list( map(lambda c: c.rgb, color_sealevel.range_to(color_peak, num_colors)) ) )                
+                waterline_range = 1.0 - world.get_param('WaterlineHeight')
 
-            waterline_range = 1.0 - world.get_param('WaterlineHeight')
+                def cell_color(idx):
+                    color_pct = (world.cp_elevation[idx] - world.get_param('WaterlineHeight')) / waterline_range
+                    color_idx = math.floor(num_colors * color_pct)
 
-            def cell_color(idx):
-                color_pct = (world.cp_elevation[idx] - world.get_param('WaterlineHeight')) / waterline_range
-                color_idx = math.floor(num_colors * color_pct)
+                    return gradient[color_idx]
 
-                return gradient[color_idx]
+                for cell_idx in cell_idxs:
+                    region = transform_points( vd.get_region(cell_idx) )
 
-            for cell_idx in cell_idxs:
-                region = list( map(lambda pt: transform(pt), vd.get_region(cell_idx)) )
+                    # color_pct = (world.cp_elevation[cell_idx] - world.get_param('WaterlineHeight')) / waterline_range
+                    # color_idx = math.floor(num_colors * color_pct)
 
-                # color_pct = (world.cp_elevation[cell_idx] - world.get_param('WaterlineHeight')) / waterline_range
-                # color_idx = math.floor(num_colors * color_pct)
+                    cell_colors[cell_idx] = cell_color(cell_idx)
 
-                cell_colors[cell_idx] = cell_color(cell_idx)
+                    if cell_colors[cell_idx] != gradient[0]:
+                        # color = gradient[color_idx]
+                        draw_region(ctx, region, cell_colors[cell_idx])
 
-                if cell_colors[cell_idx] != gradient[0]:
-                    # color = gradient[color_idx]
-                    draw_region(ctx, region, cell_colors[cell_idx])
+                ctx.restore()
 
-            ctx.restore()
+                # Render border
+                ctx.append_path(landform_path)
+                ctx.set_source_rgba(*PrintTheme.WaterShore)
+                ctx.set_line_width(0.0015)
+                ctx.set_line_join(cairo.LINE_JOIN_BEVEL)
+                ctx.set_line_cap(cairo.LINE_CAP_ROUND)
 
-            # Render border
-            ctx.append_path(landform_path)
-            ctx.set_source_rgba(*PrintTheme.WaterShore)
-            ctx.set_line_width(0.0015)
-            ctx.set_line_join(cairo.LINE_JOIN_BEVEL)
-            ctx.set_line_cap(cairo.LINE_CAP_ROUND)
+                ctx.stroke()
 
-            ctx.stroke()
 
         # Draw entities (stage 1)
         print('   * [3 / X] Rendering iconography...')
-        for entity in world.entities():        
-            try:
-                entity.render_stage1(ctx, world, vd, theme)
-            except NotImplementedError:
-                pass
-
-        # Draw land iconography
-        idx_latsort = sorted(
-            numpy.argwhere(world.cp_celltype == Cell.Type.LAND)[:, 0], 
-            key=lambda idx: world.cp_latitude[idx], 
-            reverse=True,
-        )
-
-        def between(val, lower, upper):
-            return val >= lower and val <= upper
-
-        for idx in idx_latsort:
-            if world.cp_forest_id[idx] != -1 and random.random() < 2.0 / world.std_density(2):
-                pt = transform( (world.cp_longitude[idx], world.cp_latitude[idx]) )
-                render_tree(ctx, pt)
+        with profiler.stage('Rendering iconography', 'render'):
+            for entity in world.entities():        
+                try:
+                    entity.render_stage1(ctx, world, vd, theme)
+                except NotImplementedError:
+                    pass
+
+            # Draw land iconography
+            idx_latsort = sorted(
+                numpy.argwhere(world.cp_celltype == Cell.Type.LAND)[:, 0], 
+                key=lambda idx: world.cp_latitude[idx], 
+                reverse=True,
+            )
+
+            def between(val, lower, upper):
+                return val >= lower and val <= upper
+
+            (water_dist, _) = world.distance_field('celltype', Cell.Type.WATER, max_distance=3)
+
+            for idx in idx_latsort:
+                if world.cp_forest_id[idx] != -1 and random.random() < 2.0 / world.std_density(2):
+                    pt = transform( (world.cp_longitude[idx], world.cp_latitude[idx]) )
+                    render_tree(ctx, pt)
             
-            elif between( world.cp_elevation[idx], 0.6, 0.75 ) and random.random() < 1.0 / world.std_density(3):
-                # render_hill(ctx, (world.cp_longitude[idx], world.cp_latitude[idx]))
+                elif between( world.cp_elevation[idx], 0.6, 0.75 ) and random.random() < 1.0 / world.std_density(3):
+                    # render_hill(ctx, (world.cp_longitude[idx], world.cp_latitude[idx]))
 
-                pos = transform((world.cp_longitude[idx], world.cp_latitude[idx]))
+                    pos = transform((world.cp_longitude[idx], world.cp_latitude[idx]))
 
-                draw_hill(ctx, pos, {
-                    'fill_color': cell_colors[idx],
-                })
+                    draw_hill(ctx, pos, {
+                        'fill_color': cell_colors[idx],
+                    })
 
-            elif between( world.cp_elevation[idx], world.get_param('MountainMinHeight'), 1.0 ) and random.random() < 1.0 / world.std_density(2):
-                # Don't render hills near water
-                _, distance = world.graph.distance(
-                    idx,
-                    lambda d_idx: world.cp_celltype[d_idx] == Cell.Type.WATER, 
-                    max_distance=4,
-                )
+                elif between( world.cp_elevation[idx], world.get_param('MountainMinHeight'), 1.0 ) and random.random() < 1.0 / world.std_density(2):
+                    # Don't render hills near water
+                    if water_dist[idx] == -1:
+                        pos = transform((world.cp_longitude[idx], world.cp_latitude[idx]))
+
+                        ctx.save()
+                        draw_mountain(ctx, pos, {
+                            'fill_color': (0.90, 0.90, 0.90),
+                            'width': 0.03,
+                        })
+                        ctx.restore()
+
+            # Draw entities (stage 2)
+            for entity in world.entities():
+                try:
+                    entity.render_stage2(ctx, world, vd, theme)
+                except NotImplementedError:
+                    pass
 
-                if distance > 3:
-                    pos = transform((world.cp_longitude[idx], world.cp_latitude[idx]))
 
-                    ctx.save()
-                    draw_mountain(ctx, pos, {
-                        'fill_color': (0.90, 0.90, 0.90),
-                        'width': 0.03,
-                    })
-                    ctx.restore()
-
-        # Draw entities (stage 2)
-        for entity in world.entities():
-            try:
-                entity.render_stage2(ctx, world, vd, theme)
-            except NotImplementedError:
-                pass
-                
         # Place labels
         print('   * [4 / X] Placing labels...')
-        labels = []
-        for entity in world.entities():
-            # TODO: remove once we want to render mountain labels (once they're being rendered)
-            if isinstance(entity, City) or (isinstance(entity, PointOfInterest) and entity.type == PointOfInterest.Type.LAKE):
-                if hasattr(entity, 'cell_idx') and hasattr(entity, 'name'):
-                    x, y = world.cp_longitude[entity.cell_idx], world.cp_latitude[entity.cell_idx]
-                    w, h = label_dim(ctx, entity.name)
+        with profiler.stage('Placing labels', 'render'):
+            labels = []
+            for entity in world.entities():
+                # TODO: remove once we want to render mountain labels (once they're being rendered)
+                if isinstance(entity, City) or (isinstance(entity, PointOfInterest) and entity.type == PointOfInterest.Type.LAKE):
+                    if hasattr(entity, 'cell_idx') and hasattr(entity, 'name'):
+                        x, y = world.cp_longitude[entity.cell_idx], world.cp_latitude[entity.cell_idx]
+                        w, h = label_dim(ctx, entity.name)
 
-                    font_scale = 1.0
+                        font_scale = 1.0
 
-                    if isinstance(entity, City):
-                        font_scale -= ((entity.MaxSize - entity.size()) / entity.MaxSize) * 0.3
+                        if isinstance(entity, City):
+                            font_scale -= ((entity.MaxSize - entity.size()) / entity.MaxSize) * 0.3
 
-                    labels.append( Label((x, y), (w, h), entity.name, font_scale) )
+                        labels.append( Label((x, y), (w, h), entity.name, font_scale) )
 
-        # Optimize label positions
-        iter_count = 0
-        conflicts = find_conflicts(labels)
+            # Optimize label positions
+            iter_count = 0
+            conflicts = find_conflicts(labels)
 
-        while len(conflicts) > 0 and iter_count < 100:
-            # Shift one of the conflicting labels
-            random.choice(conflicts).shift()
+            while len(conflicts) > 0 and iter_count < 100:
+                # Shift one of the conflicting labels
+                random.choice(conflicts).shift()
 
-            conflicts = find_conflicts(labels)
-            iter_count += 1
+                conflicts = find_conflicts(labels)
+                iter_count += 1
+
+            # Render optimized labels
+            for label in labels:
+                top_left = transform( (label.position()[0], label.position()[1]) )
+                render_text(ctx, top_left, label.text, label.font_scale)
 
-        # Render optimized labels
-        for label in labels:
-            top_left = transform( (label.position()[0], label.position()[1]) )
-            render_text(ctx, top_left, label.text, label.font_scale)
 
-        close_surface(output_fmt, surface)
\ No newline at end of file
+        with profiler.stage('Writing %s' % (output_fmt,), 'render'):
+            close_surface(output_fmt, surface)
\ No newline at end of file
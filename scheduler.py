@@ -0,0 +1,209 @@
+import concurrent.futures, importlib, pkgutil, time
+import errors, profiler
+
+import plugins
+
+def load_plugins():
+    '''
+    Dynamically load all plugins from the `plugins/` directory.
+    '''
+    plugin_list = pkgutil.iter_modules(plugins.__path__, plugins.__name__ + '.')
+
+    modules = []
+    for _, name, __ in plugin_list:
+        modules.append( importlib.import_module(name) )
+
+    return modules
+
+class Scheduler(object):
+    '''
+    Schedulers decide the order that plugins run in. The dependency graph is built once from the
+    `@genreq` metadata on each plugin's `generate` function: a plugin depends on the plugin that
+    produces each of the cell properties or world params it requires.
+
+    Plugins that rewrite an existing value (i.e. `form_lakes` rewriting `celltype`) declare it in
+    `mutates`. A mutating plugin runs after the value's producer and before everyone that reads
+    the value. Every value has exactly one producer and at most one mutator; anything else is a
+    write-write conflict and is rejected up front.
+
+    Plugins with no path between them in the graph are independent and can run concurrently.
+    '''
+
+    def __init__(self, plugin_list):
+        self.plugins = { pl.__name__: pl for pl in plugin_list }
+
+        # name => set of plugin names that must finish first
+        self.depends_on = { name: set() for name in self.plugins }
+        # name => set of plugin names waiting on this one
+        self.dependents = { name: set() for name in self.plugins }
+
+        producers = {}  # value => plugin name
+        mutators = {}   # value => plugin name
+
+        for name, pl in self.plugins.items():
+            for output in Scheduler.produces(pl):
+                if output in Scheduler.requirements(pl):
+                    raise errors.WriteConflictError(
+                        'Plugin %s both requires and produces "%s"; declare it in `mutates` instead' % (name, output)
+                    )
+
+                if output in producers:
+                    raise errors.WriteConflictError(
+                        'Plugins %s and %s both produce "%s"' % (producers[output], name, output)
+                    )
+
+                producers[output] = name
+
+            for output in Scheduler.mutates(pl):
+                if output in mutators:
+                    raise errors.WriteConflictError(
+                        'Plugins %s and %s both mutate "%s"' % (mutators[output], name, output)
+                    )
+
+                mutators[output] = name
+
+        for name, pl in self.plugins.items():
+            for req in Scheduler.requirements(pl):
+                if req not in producers:
+                    raise errors.UnsatisfiableDependencyError(
+                        'Plugin %s requires "%s", which is not produced by any plugin' % (name, req)
+                    )
+
+                self._add_dependency(name, producers[req])
+
+                # Readers see the value after it's been mutated.
+                if req in mutators and mutators[req] != name:
+                    self._add_dependency(name, mutators[req])
+
+        self.order = self._toposort()
+
+    @staticmethod
+    def requirements(plugin):
+        '''
+        All values that must exist before the plugin runs. Mutated values are implicitly required.
+        '''
+        genfunc = plugin.generate
+        reqs = list( getattr(genfunc, 'cellprops', []) ) + list( getattr(genfunc, 'worldparams', []) )
+
+        return reqs + [m for m in Scheduler.mutates(plugin) if m not in reqs]
+
+    @staticmethod
+    def produces(plugin):
+        return list( getattr(plugin.generate, 'produces', []) )
+
+    @staticmethod
+    def mutates(plugin):
+        return list( getattr(plugin.generate, 'mutates', []) )
+
+    @staticmethod
+    def outputs(plugin):
+        '''
+        All values the plugin writes, either by creating them or by replacing them.
+        '''
+        return Scheduler.produces(plugin) + Scheduler.mutates(plugin)
+
+    def _add_dependency(self, name, upstream):
+        self.depends_on[name].add(upstream)
+        self.dependents[upstream].add(name)
+
+    def _toposort(self):
+        '''
+        Kahn's algorithm; returns plugin names in a valid execution order and raises a
+        DependencyCycleError if some plugins can never become ready.
+        '''
+        remaining = { name: len(deps) for name, deps in self.depends_on.items() }
+        ready = sorted( [name for name, count in remaining.items() if count == 0] )
+        order = []
+
+        while len(ready) > 0:
+            name = ready.pop(0)
+            order.append(name)
+
+            for dependent in sorted(self.dependents[name]):
+                remaining[dependent] -= 1
+
+                if remaining[dependent] == 0:
+                    ready.append(dependent)
+
+        if len(order) < len(self.plugins):
+            stuck = sorted( [name for name in self.plugins if name not in order] )
+
+            raise errors.DependencyCycleError('Plugins have circular dependencies: %s' % (', '.join(stuck),))
+
+        return order
+
+    def run(self, world, vd, workers=1, on_finish=None, cache=None):
+        '''
+        Run all plugins against the world. Up to `workers` independent plugins run concurrently
+        on a thread pool. `on_finish(plugin, elapsed_ms, cached)` is called as each plugin completes.
+
+        Each plugin's entities are held back and added to the world in execution order (see
+        `self.order`), so entities come out in the same order no matter how many workers run.
+
+        If a PluginCache is provided, plugins whose inputs haven't changed since a previous run
+        are loaded from the cache instead of being run.
+        '''
+        def run_plugin(name):
+            pl = self.plugins[name]
+            cached = False
+
+            start_ts = time.time() * 1000
+            with profiler.stage(name, 'plugin'), world.record_entities() as entities:
+                if cache is None:
+                    pl.generate(world, vd)
+                else:
+                    key = cache.key(pl, world, vd, Scheduler.requirements(pl))
+                    cached = cache.load(pl, key, world)
+
+                    if not cached:
+                        pl.generate(world, vd)
+
+                        cache.store(pl, key, world, Scheduler.outputs(pl), entities)
+            end_ts = time.time() * 1000
+
+            for output in Scheduler.produces(pl):
+                if not world.has_cell_property(output) and not world.has_param(output):
+                    raise errors.MissingOutputError('Plugin %s did not produce "%s"' % (name, output))
+
+            return (end_ts - start_ts, cached, entities)
+
+        remaining = { name: len(deps) for name, deps in self.depends_on.items() }
+
+        # Entities of finished plugins wait here until every plugin before them in `self.order`
+        # has finished too.
+        pending_entities = {}
+        committed = 0
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+            running = {}
+
+            def submit_ready(names):
+                # Submit in topological order so single-worker runs are deterministic.
+                for name in sorted(names, key=self.order.index):
+                    running[ pool.submit(run_plugin, name) ] = name
+
+            submit_ready([name for name, count in remaining.items() if count == 0])
+
+            while len(running) > 0:
+                done, _ = concurrent.futures.wait(running.keys(), return_when=concurrent.futures.FIRST_COMPLETED)
+
+                newly_ready = []
+                for future in done:
+                    name = running.pop(future)
+                    (elapsed, cached, entities) = future.result()
+                    pending_entities[name] = entities
+
+                    while committed < len(self.order) and self.order[committed] in pending_entities:
+                        world.commit_entities( pending_entities.pop(self.order[committed]) )
+                        committed += 1
+
+                    if on_finish is not None:
+                        on_finish(self.plugins[name], elapsed, cached)
+
+                    for dependent in self.dependents[name]:
+                        remaining[dependent] -= 1
+
+                        if remaining[dependent] == 0:
+                            newly_ready.append(dependent)
+
+                submit_ready(newly_ready)
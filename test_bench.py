@@ -0,0 +1,34 @@
+import unittest
+
+import bench
+
+PointCounts = [1000, 2000, 4000, 8000]
+
+class BenchTestCase(unittest.TestCase):
+    def test_scaling_exponent(self):
+        linear = [0.5 * n for n in PointCounts]
+        quadratic = [0.001 * n * n for n in PointCounts]
+
+        self.assertAlmostEqual(bench.scaling_exponent(PointCounts, linear), 1.0, places=6)
+        self.assertAlmostEqual(bench.scaling_exponent(PointCounts, quadratic), 2.0, places=6)
+
+        # Missing and zero timings are skipped
+        self.assertAlmostEqual(bench.scaling_exponent(PointCounts, [None, 0.0] + quadratic[2:]), 2.0, places=6)
+        self.assertIsNone( bench.scaling_exponent(PointCounts, [None, None, None, 8.0]) )
+        self.assertIsNone( bench.scaling_exponent([], []) )
+
+    def test_report(self):
+        results = {
+            'linear': { 'times': [0.5 * n for n in PointCounts], 'exponent': 1.0 },
+            'quadratic': { 'times': [0.001 * n * n for n in PointCounts], 'exponent': 2.0 },
+            'partial': { 'times': [None, None, None, 8.0], 'exponent': None },
+        }
+
+        self.assertEqual(bench.report(PointCounts, results, 1.3), ['quadratic'])
+        self.assertEqual(bench.report(PointCounts, results, 2.5), [])
+
+    def test_exit_status(self):
+        args = ['--points', '200,400', '--no-render', '--no-warmup']
+
+        self.assertEqual(bench.main(args + ['--max-exponent', '100']), 0)
+        self.assertEqual(bench.main(args + ['--max-exponent', '-100']), 1)
@@ -0,0 +1,88 @@
+import os, sys, tempfile, types, unittest, numpy
+
+import cache, world
+from entity import Entity
+from world import Cell
+
+# This module doubles as the plugin being cached so the cache can read its source.
+plugin = sys.modules[__name__]
+
+def generate(w, vd):
+    w.add_cell_property('elevation', numpy.linspace(0, 1, w.get_cellcount()))
+    w.set_param('WaterlineHeight', 0.4)
+    w.add_entity( Entity(None, 'Riverrun') )
+
+def build(seed=7):
+    w = world.World(list( range(10) ), None, None, seed)
+    w.add_cell_property('celltype', numpy.array([Cell.Type.LAND,] * 10, dtype=object))
+
+    vd = types.SimpleNamespace( vor=types.SimpleNamespace(points=numpy.zeros((10, 2))) )
+
+    return (w, vd)
+
+class PluginCacheTestCase(unittest.TestCase):
+    def setUp(self):
+        self.folder = tempfile.TemporaryDirectory()
+        self.cache = cache.PluginCache(self.folder.name)
+
+    def tearDown(self):
+        self.folder.cleanup()
+
+    def test_roundtrip(self):
+        (w, vd) = build()
+        key = self.cache.key(plugin, w, vd, ['celltype'])
+
+        self.assertFalse( self.cache.load(plugin, key, w) )
+
+        with w.record_entities() as entities:
+            generate(w, vd)
+
+        self.cache.store(plugin, key, w, ['elevation', 'WaterlineHeight'], entities)
+
+        (fresh, vd) = build()
+        self.assertTrue( self.cache.load(plugin, key, fresh) )
+
+        numpy.testing.assert_array_equal(fresh.cp_elevation, w.cp_elevation)
+        self.assertEqual(fresh.get_param('WaterlineHeight'), 0.4)
+        self.assertEqual([e.name for e in fresh.entities()], ['Riverrun'])
+
+    def test_key_changes_with_inputs(self):
+        (w, vd) = build()
+        key = self.cache.key(plugin, w, vd, ['celltype'])
+
+        self.assertEqual(key, self.cache.key(plugin, build()[0], vd, ['celltype']))
+        self.assertNotEqual(key, self.cache.key(plugin, build(seed=8)[0], vd, ['celltype']))
+
+        w.cp_celltype[3] = Cell.Type.WATER
+        self.assertNotEqual(key, self.cache.key(plugin, w, vd, ['celltype']))
+
+    def test_key_covers_project_modules(self):
+        names = set([module.__name__ for module in cache.project_modules(plugin)])
+
+        # Imported helpers (and what they import in turn) are hashed along with the plugin...
+        self.assertTrue( set([__name__, 'cache', 'world', 'entity', 'errors', 'noisefield']) <= names )
+        # ...but libraries aren't.
+        self.assertNotIn('numpy', names)
+
+    def test_eviction(self):
+        (w, vd) = build()
+        with w.record_entities() as entities:
+            generate(w, vd)
+
+        keys = ['a' * 64, 'b' * 64, 'c' * 64]
+        for key in keys:
+            self.cache.store(plugin, key, w, ['elevation'], entities)
+
+        entry_size = os.path.getsize( self.cache._filename(plugin, keys[0]) )
+
+        # Using the oldest entry keeps it around; the least recently used one goes first.
+        os.utime(self.cache._filename(plugin, keys[0]), (0, 0))
+        os.utime(self.cache._filename(plugin, keys[1]), (1, 1))
+        self.assertTrue( self.cache.load(plugin, keys[0], build()[0]) )
+
+        self.cache.max_bytes = entry_size * 2
+        self.cache.evict()
+
+        self.assertFalse( self.cache.load(plugin, keys[1], build()[0]) )
+        self.assertTrue( self.cache.load(plugin, keys[0], build()[0]) )
+        self.assertTrue( self.cache.load(plugin, keys[2], build()[0]) )
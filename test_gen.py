@@ -0,0 +1,128 @@
+import json, os, tempfile, unittest, numpy
+
+import langserver_conf as lsc
+lsc.UseStub = True
+
+import cache, gen, profiler
+
+def load_world(folder):
+    with open(os.path.join(folder, 'world.json')) as fp:
+        data = json.load(fp)
+
+    with numpy.load(os.path.join(folder, 'cells.npz')) as cells:
+        cellprops = { name: cells[name] for name in cells.files }
+
+    return (data, cellprops)
+
+def plugin_stages(folder):
+    with open(os.path.join(folder, 'profile.json')) as fp:
+        return [stage for stage in json.load(fp) if stage['category'] == 'plugin']
+
+def world_outputs(seed, workers):
+    (w, vd) = gen.build_world(gen.PointCount, seed, verbose=False)
+    gen.generate_world(w, vd, workers=workers, verbose=False)
+
+    entities = [(type(entity).__name__, entity.name, getattr(entity, 'cell_idx', None)) for entity in w.entities()]
+
+    return (w.id, w.cell_properties(), entities)
+
+class GenerateTestCase(unittest.TestCase):
+    def setUp(self):
+        self.point_count = gen.PointCount
+        gen.PointCount = 1000
+
+    def tearDown(self):
+        gen.PointCount = self.point_count
+
+    def test_generate_twice(self):
+        with tempfile.TemporaryDirectory() as output_folder:
+            folder = gen.generate(0, 1234, output_folder)
+            self.assertTrue( os.path.isfile(os.path.join(folder, 'world.json')) )
+
+            # An existing world is skipped rather than failing or being regenerated
+            os.remove(os.path.join(folder, 'world.json'))
+            self.assertEqual(gen.generate(0, 1234, output_folder), folder)
+            self.assertFalse( os.path.exists(os.path.join(folder, 'world.json')) )
+
+            # ...unless it's forced, in which case it's written again
+            self.assertEqual(gen.generate(0, 1234, output_folder, force=True), folder)
+            self.assertTrue( os.path.isfile(os.path.join(folder, 'world.json')) )
+
+    def test_profiler_deactivated_on_error(self):
+        def build_world(point_count, seed, verbose=True):
+            raise RuntimeError('build failed')
+
+        original = gen.build_world
+        gen.build_world = build_world
+
+        try:
+            with tempfile.TemporaryDirectory() as output_folder:
+                with self.assertRaises(RuntimeError):
+                    gen.generate(0, 1234, output_folder)
+        finally:
+            gen.build_world = original
+
+        self.assertIsNone(profiler.active)
+
+    def test_generate_cached(self):
+        with tempfile.TemporaryDirectory() as cache_folder, \
+             tempfile.TemporaryDirectory() as first_output, \
+             tempfile.TemporaryDirectory() as second_output:
+            first = gen.generate(0, 1234, first_output, cache_folder=cache_folder)
+            second = gen.generate(0, 1234, second_output, cache_folder=cache_folder)
+
+            # Every plugin missed the cache the first time around and was loaded from it the second
+            self.assertTrue( all(stage['counters'].get('cache.miss') == 1 for stage in plugin_stages(first)) )
+
+            stages = plugin_stages(second)
+            self.assertGreater(len(stages), 0)
+            for stage in stages:
+                self.assertEqual(stage['counters'].get('cache.hit'), 1, stage['name'])
+                self.assertNotIn('cache.miss', stage['counters'], stage['name'])
+
+            (first_data, first_cells) = load_world(first)
+            (second_data, second_cells) = load_world(second)
+
+            self.assertEqual(first_data, second_data)
+            self.assertEqual(sorted(first_cells), sorted(second_cells))
+            for name in first_cells:
+                numpy.testing.assert_array_equal(first_cells[name], second_cells[name], err_msg=name)
+
+    def test_generate_world_cached(self):
+        with tempfile.TemporaryDirectory() as cache_folder:
+            plugin_cache = cache.PluginCache(cache_folder)
+            runs = []
+
+            for _ in range(2):
+                (w, vd) = gen.build_world(gen.PointCount, 1234, verbose=False)
+                finished = {}
+
+                def on_finish(pl, elapsed_ms, cached):
+                    finished[pl.__name__] = cached
+
+                gen.generate_world(w, vd, verbose=False, plugin_cache=plugin_cache, on_finish=on_finish)
+                runs.append(finished)
+
+            self.assertEqual(sorted(runs[0]), sorted(runs[1]))
+            self.assertFalse( any(runs[0].values()) )
+            self.assertTrue( all(runs[1].values()) )
+
+    def test_reproducible(self):
+        (world_id, cellprops, entities) = world_outputs(1234, workers=1)
+
+        # The same seed gives the same world no matter how many plugins run at once
+        (parallel_id, parallel_cellprops, parallel_entities) = world_outputs(1234, workers=4)
+
+        self.assertEqual(parallel_id, world_id)
+        self.assertEqual(sorted(parallel_cellprops), sorted(cellprops))
+        for name in cellprops:
+            numpy.testing.assert_array_equal(parallel_cellprops[name], cellprops[name], err_msg=name)
+        self.assertEqual(parallel_entities, entities)
+        self.assertGreater(len(entities), 0)
+
+        # ...and a different seed gives a different one
+        (other_id, other_cellprops, other_entities) = world_outputs(4321, workers=1)
+
+        self.assertNotEqual(other_id, world_id)
+        self.assertFalse( numpy.array_equal(other_cellprops['elevation'], cellprops['elevation']) )
+        self.assertNotEqual(other_entities, entities)
@@ -1,5 +1,5 @@
-import unittest
-import graph
+import unittest, numpy
+import graph, voronoi
 
 def g1():
     edges = [
@@ -45,4 +45,142 @@ class GraphTestCase(unittest.TestCase):
             lambda _, idxs, __: idxs, 
             lambda idx: idx == 5,
             max_distance=1
-        ), (None, -1))
\ No newline at end of file
+        ), (None, -1))
+
+    def test_build_graph(self):
+        points = numpy.random.default_rng(1).random((500, 2))
+        vor = voronoi.generate(points)
+        cell_idxs = list( range(len(points)) )
+        mapping = { idx: vor.point_region[idx] for idx in cell_idxs }
+
+        by_ridge = graph.BuildGraph(cell_idxs, vor, mapping)
+        by_vertex = graph.BuildGraph(cell_idxs, vor, mapping, adjacency='vertex')
+
+        self.assertEqual(by_ridge.node_count(), len(points))
+
+        # Every pair of neighbors is connected once
+        edges = list( by_ridge.edges() )
+        self.assertEqual(len(edges), len( set( map(lambda e: tuple(sorted(e)), edges) ) ))
+
+        # In a diagram without cocircular sites, cells that share a vertex also share a ridge.
+        self.assertEqual(sorted(edges), sorted( by_vertex.edges() ))
+
+        # Cells separated by a ridge are neighbors
+        (a, b) = vor.ridge_points[ numpy.all(vor.ridge_points < len(points), axis=1) ][0]
+        self.assertIn(b, by_ridge.neighbors(a))
+
+    def test_distances(self):
+        # 0 - 1 - 2 - 3 - 4, plus 5 which is disconnected
+        g = graph.Graph([ (0, 1), (1, 2), (2, 3), (3, 4) ], node_count=6)
+
+        self.assertEqual(g.distances([0,]).tolist(), [0, 1, 2, 3, 4, -1])
+        self.assertEqual(g.distances([0, 4]).tolist(), [0, 1, 2, 1, 0, -1])
+        self.assertEqual(g.distances([0,], max_distance=2).tolist(), [0, 1, 2, -1, -1, -1])
+
+        mask = numpy.array([True, True, False, True, True, True])
+        self.assertEqual(g.distances([0,], mask=mask).tolist(), [0, 1, -1, -1, -1, -1])
+        self.assertEqual(g.floodfill(4, mask), [3, 4])
+
+        self.assertEqual(g.distance(0, numpy.array([False, False, False, True, True, False])), (3, 3))
+        self.assertEqual(g.distance(0, lambda idx: idx >= 3), (3, 3))
+        self.assertEqual(g.distance(0, lambda idx: idx >= 3, max_distance=2), (None, 2))
+
+        self.assertEqual(g.subgraph(mask).edge_count(), 2)
+
+    def test_bfs_kernels(self):
+        points = numpy.random.default_rng(2).random((400, 2))
+        vor = voronoi.generate(points)
+        cell_idxs = list( range(len(points)) )
+        g = graph.BuildGraph(cell_idxs, vor, { idx: vor.point_region[idx] for idx in cell_idxs })
+
+        sources = numpy.array([3, 17, 250], dtype=numpy.int32)
+        mask = points[:, 0] < 0.7
+
+        for max_distance in (-1, 3):
+            (expected, nearest) = graph.bfs_numpy(g.indptr, g.indices, sources, mask, max_distance)
+
+            if graph.numba is not None:
+                numpy.testing.assert_array_equal(graph.bfs_numba(g.indptr, g.indices, sources, mask, max_distance)[0], expected)
+
+            # Every reached node is `dist` steps from its nearest source
+            for idx in numpy.flatnonzero(expected > 0)[::20]:
+                self.assertEqual(g.distances([ nearest[idx], ], mask=mask)[idx], expected[idx])
+
+            # Check against a plain BFS
+            dist = { int(source): 0 for source in sources }
+            queue = list( dist.keys() )
+            while len(queue) > 0:
+                node = queue.pop(0)
+
+                if max_distance >= 0 and dist[node] >= max_distance:
+                    continue
+
+                for neighbor in g.neighbors(node):
+                    if neighbor not in dist and mask[neighbor]:
+                        dist[neighbor] = dist[node] + 1
+                        queue.append(neighbor)
+
+            self.assertEqual(expected.tolist(), [dist.get(idx, -1) for idx in cell_idxs])
+
+    def test_subgraph_view(self):
+        # 0 - 1 - 2 - 3 - 4
+        g = graph.Graph([ (0, 1), (1, 2), (2, 3), (3, 4) ])
+        view = g.subgraph( numpy.array([True, True, False, True, True]) )
+
+        # Views share the parent's arrays
+        self.assertIs(view.indices, g.indices)
+        self.assertIs(view.indptr, g.indptr)
+
+        self.assertEqual(view.edge_count(), 2)
+        self.assertEqual(list( view.edges() ), [ (0, 1), (3, 4) ])
+        self.assertEqual(view.neighbors(1), [0,])
+        self.assertEqual(view.neighbors(2), [])
+        self.assertEqual(view.floodfill(3), [3, 4])
+        self.assertEqual(view.distance(0, lambda idx: idx == 4), (None, None))
+
+        # Views of views combine their masks
+        self.assertEqual(view.subgraph( numpy.array([True, True, True, True, False]) ).edge_count(), 1)
+
+    def test_components(self):
+        g = graph.Graph([ (0, 1), (2, 3), (3, 4), (5, 6) ], node_count=8)
+
+        (labels, sizes) = g.components()
+        self.assertEqual(labels.tolist(), [0, 0, 1, 1, 1, 2, 2, 3])
+        self.assertEqual(sizes.tolist(), [2, 3, 2, 1])
+
+        # Removing node 3 splits the second component
+        (labels, sizes) = g.components( numpy.array([True, True, True, False, True, True, True, True]) )
+        self.assertEqual(labels.tolist(), [0, 0, 1, -1, 2, 3, 3, 4])
+        self.assertEqual(sizes.tolist(), [2, 1, 1, 2, 1])
+
+        members = graph.component_members(labels)
+        self.assertEqual([m.tolist() for m in members], [ [0, 1], [2,], [4,], [5, 6], [7,] ])
+
+        centroids = graph.component_centroids(labels, numpy.arange(8), numpy.zeros(8))
+        self.assertEqual(centroids[:, 0].tolist(), [0.5, 2.0, 4.0, 5.5, 7.0])
+
+    def test_rings(self):
+        points = numpy.random.default_rng(4).random((300, 2))
+        vor = voronoi.generate(points)
+        mapping = { i: vor.point_region[i] for i in range(len(points)) }
+        g = graph.BuildGraph(list( range(len(points)) ), vor, mapping)
+
+        sources = [0, 17, 17, 299]
+        (offsets, nodes) = g.rings_many(sources, 4)
+        self.assertEqual(offsets.shape, (4, 6))
+
+        for i, source in enumerate(sources):
+            dist = g.distances([source,])
+
+            for d in range(5):
+                self.assertEqual(nodes[ offsets[i, d]:offsets[i, d + 1] ].tolist(), numpy.flatnonzero(dist == d).tolist())
+
+        (offsets, nodes) = g.rings(17, 3)
+        self.assertEqual(g.neighbors(17, 3), nodes[ offsets[3]:offsets[4] ].tolist())
+        self.assertEqual(g.all_within(17, 4), numpy.flatnonzero( (g.distances([17,]) > 0) & (g.distances([17,]) < 4) ).tolist())
+
+        # Views only walk through nodes in the mask.
+        line = graph.Graph([ (0, 1), (1, 2), (2, 3), (3, 4) ]).subgraph( numpy.array([True, True, False, True, True]) )
+        (offsets, nodes) = line.rings(0, 3)
+        self.assertEqual(offsets.tolist(), [0, 1, 2, 2, 2])
+        self.assertEqual(nodes.tolist(), [0, 1])
@@ -0,0 +1,131 @@
+import unittest, numpy
+
+import graph, scheduler, voronoi, world
+from plugins import calc_moisture, calc_climate, form_lakes, form_rivers, form_terrain, init_cells, mark_landforms, tectonics
+from world import Cell
+
+def grid_world(columns, rows, water):
+    '''
+    A `columns` x `rows` grid of cells; cell (c, r) is `r * columns + c` and sits at
+    longitude c / columns, latitude r / rows. Cells in `water` are water, the rest are land.
+    '''
+    edges = []
+    for r in range(rows):
+        for c in range(columns):
+            idx = r * columns + c
+
+            if c + 1 < columns:
+                edges.append( (idx, idx + 1) )
+            if r + 1 < rows:
+                edges.append( (idx, idx + columns) )
+
+    w = world.World(list( range(columns * rows) ), None, graph.Graph(edges, node_count=columns * rows))
+
+    (r, c) = numpy.divmod(numpy.arange(columns * rows), columns)
+    w.add_cell_property('longitude', c / columns)
+    w.add_cell_property('latitude', r / rows)
+
+    celltype = numpy.array([Cell.Type.LAND,] * (columns * rows), dtype=object)
+    celltype[list(water)] = Cell.Type.WATER
+    w.add_cell_property('celltype', celltype)
+
+    return w
+
+def ridge_world(ridge):
+    # Ocean along the left edge, land to the right; with `ridge`, a line of mountains in column 10.
+    (columns, rows) = (30, 5)
+    w = grid_world(columns, rows, [r * columns for r in range(rows)])
+
+    elevation = numpy.full(columns * rows, 0.5)
+    if ridge:
+        elevation[ numpy.arange(rows) * columns + 10 ] = 0.9
+
+    w.add_cell_property('elevation', elevation)
+    w.set_param('MountainMinHeight', 0.75)
+
+    return w
+
+def voronoi_world(point_count, seed):
+    points = world.random_stream(seed, 'points').random((point_count, 2))
+    vor = voronoi.generate(points)
+    mapping = voronoi.CellMapping.from_points(vor, point_count)
+
+    cell_idxs = list( range(point_count) )
+    w = world.World(cell_idxs, vor, graph.BuildGraph(cell_idxs, vor, mapping), seed, mapping)
+
+    return (w, voronoi.VoronoiDiagram(vor, mapping))
+
+class MoistureTestCase(unittest.TestCase):
+    def test_water_bonus(self):
+        # Water in the top left corner and one lake; the far corner is more than 3 steps away.
+        w = grid_world(8, 6, [0, 1, 8, 29])
+
+        def old_bonus(idx):
+            # The per-cell version this replaced: a full BFS to the closest water for every cell.
+            (_, dist_water) = w.graph.distance(idx, lambda dest_idx: w.cp_celltype[dest_idx] == Cell.Type.WATER)
+
+            if w.cp_celltype[idx] == Cell.Type.WATER:
+                return 0.25
+            elif dist_water == 1:
+                return 0.2
+            elif dist_water == 2:
+                return 0.12
+            elif dist_water == 3:
+                return 0.04
+
+            return 0.0
+
+        expected = [old_bonus(idx) for idx in w.cell_idxs()]
+        self.assertEqual(calc_moisture.water_bonus(w).tolist(), expected)
+
+        # Every bucket is covered, including cells farther than 3 steps from water.
+        self.assertEqual(sorted(set(expected)), [0.0, 0.04, 0.12, 0.2, 0.25])
+
+    def test_advect_water(self):
+        w = ridge_world(False)
+        arriving = calc_moisture.advect(w, 0.0)
+
+        is_water = w.cp_celltype == Cell.Type.WATER
+        self.assertTrue( numpy.all(arriving[is_water] == 1.0) )
+
+        # The air dries out as it moves inland.
+        row = arriving[:30]
+        self.assertTrue( numpy.all(numpy.diff(row[1:]) < 0) )
+
+    def test_advect_rain_shadow(self):
+        # Wind blowing from the ocean towards the ridge.
+        without_ridge = calc_moisture.advect(ridge_world(False), 0.0)
+        with_ridge = calc_moisture.advect(ridge_world(True), 0.0)
+
+        leeward = (numpy.arange(len(with_ridge)) % 30) > 10
+        windward = (numpy.arange(len(with_ridge)) % 30) < 10
+
+        self.assertTrue( numpy.all(with_ridge[leeward] < without_ridge[leeward]) )
+        numpy.testing.assert_array_equal(with_ridge[windward], without_ridge[windward])
+
+        # With the wind the other way, the ridge casts its shadow on the ocean side instead.
+        reversed_ridge = calc_moisture.advect(ridge_world(True), numpy.pi)
+        self.assertTrue( numpy.all(reversed_ridge[leeward] == calc_moisture.advect(ridge_world(False), numpy.pi)[leeward]) )
+
+    def test_advect_reaches_every_cell(self):
+        (w, vd) = voronoi_world(600, 3)
+        init_cells.generate(w, vd)
+
+        w.add_cell_property('elevation', w.rng('elevation').random(w.get_cellcount()))
+        w.add_cell_property('celltype', numpy.where(w.cp_elevation > 0.4, Cell.Type.LAND, Cell.Type.WATER))
+        w.set_param('MountainMinHeight', 0.75)
+
+        # Cells the wavefront sweep never reached would be NaN.
+        for angle in numpy.linspace(0, 2 * numpy.pi, 7):
+            self.assertTrue( numpy.all(numpy.isfinite( calc_moisture.advect(w, angle) )) )
+
+    def test_independent_of_workers(self):
+        plugins = [init_cells, tectonics, form_terrain, form_lakes, calc_climate, calc_moisture, mark_landforms, form_rivers]
+
+        def moisture(workers):
+            (w, vd) = voronoi_world(800, 11)
+            scheduler.Scheduler(plugins).run(w, vd, workers=workers)
+
+            return w.cp_moisture
+
+        numpy.testing.assert_array_equal(moisture(1), moisture(4))
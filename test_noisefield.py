@@ -0,0 +1,43 @@
+import unittest, numpy
+
+import noise, noisefield
+
+class NoiseFieldTestCase(unittest.TestCase):
+    def test_matches_snoise2(self):
+        rng = numpy.random.default_rng(6)
+        (x, y) = rng.random((2, 500)) * 2.0 - 0.5
+
+        for (octaves, base) in [(1, 0.0), (4, 17), (16, 999)]:
+            expected = [noise.snoise2(x[i] * 3, y[i] * 3, octaves, base=base) for i in range(len(x))]
+
+            self.assertEqual(noisefield.snoise2(x * 3, y * 3, octaves, base=base).tolist(), expected)
+
+    def test_persistence_and_lacunarity(self):
+        (x, y) = numpy.random.default_rng(7).random((2, 100))
+
+        expected = [noise.snoise2(x[i], y[i], 6, persistence=1.35, lacunarity=1.5) for i in range(len(x))]
+        self.assertEqual(noisefield.snoise2(x, y, 6, persistence=1.35, lacunarity=1.5).tolist(), expected)
+
+    def test_field_matches_snoise2(self):
+        (x, y) = numpy.random.default_rng(8).random((2, 200))
+        field = noisefield.NoiseField(x, y)
+
+        for (scale, octaves) in [(3, 4), (4, 8), (8, 16)]:
+            numpy.testing.assert_array_equal(field.fbm(scale, octaves, 17), noisefield.snoise2(x * scale, y * scale, octaves, base=17))
+
+        # Scale 4 and scale 8 share every octave from frequency 8 to 512.
+        self.assertEqual(len(field._layers), 4 + 8 + 16 - 7)
+
+    def test_weighted(self):
+        (x, y) = numpy.random.default_rng(9).random((2, 50))
+        weights = [noisefield.NoiseWeight(weight=0.75, scale=2, octaves=3), noisefield.NoiseWeight(weight=0.25, scale=5, octaves=1)]
+
+        expected = 0.75 * 0.5 * (noisefield.snoise2(x * 2, y * 2, 3, base=4) + 1.0) + 0.25 * 0.5 * (noisefield.snoise2(x * 5, y * 5, 1, base=4) + 1.0)
+        numpy.testing.assert_allclose(noisefield.NoiseField(x, y).weighted(weights, 4), expected)
+
+    def test_raster(self):
+        field = noisefield.NoiseField.raster(4, 2)
+
+        self.assertEqual(field.x.tolist(), [0.125, 0.375, 0.625, 0.875] * 2)
+        self.assertEqual(field.y.tolist(), [0.25,] * 4 + [0.75,] * 4)
+        self.assertEqual(field.fbm(3, 2).reshape(2, 4).shape, (2, 4))
@@ -0,0 +1,49 @@
+import json, os, tempfile, unittest
+
+import graph, profiler
+
+class ProfilerTestCase(unittest.TestCase):
+    def setUp(self):
+        self.prof = profiler.activate( profiler.Profiler() )
+        self.graph = graph.Graph([ (0, 1), (1, 2), (2, 3) ])
+
+    def tearDown(self):
+        profiler.deactivate()
+
+    def test_counters(self):
+        with profiler.stage('plugins.first', 'plugin'):
+            self.graph.neighbors(0)
+            self.graph.distance(0, lambda idx: idx == 3)
+
+        profiler.begin('Drawing landforms', 'render')
+        self.graph.neighbors(1)
+        profiler.end()
+
+        stages = self.prof.to_json()
+
+        self.assertEqual([s['name'] for s in stages], ['plugins.first', 'Drawing landforms'])
+        self.assertEqual(stages[0]['counters'], { 'graph.neighbors': 1, 'graph.distance': 1 })
+        self.assertEqual(stages[1]['counters'], { 'graph.neighbors': 1 })
+
+    def test_inactive(self):
+        profiler.deactivate()
+
+        with profiler.stage('plugins.first', 'plugin'):
+            self.graph.neighbors(0)
+
+        self.assertEqual(self.prof.stages, [])
+
+    def test_trace(self):
+        with profiler.stage('plugins.first', 'plugin'):
+            self.graph.neighbors(0)
+
+        with tempfile.TemporaryDirectory() as folder:
+            filename = os.path.join(folder, 'trace.json')
+            self.prof.save_trace(filename)
+
+            with open(filename) as fp:
+                events = json.load(fp)['traceEvents']
+
+        self.assertEqual(len(events), 1)
+        self.assertEqual(events[0]['ph'], 'X')
+        self.assertEqual(events[0]['args']['graph.neighbors'], 1)
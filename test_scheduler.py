@@ -0,0 +1,130 @@
+import contextlib, time, types, unittest
+
+import scheduler, errors, world
+from decorators import genreq
+from entity import Entity
+
+def plugin(name, log=None, **reqs):
+    @genreq(**reqs)
+    def generate(world, vd):
+        if log is not None:
+            log.append(name)
+
+    return types.SimpleNamespace(__name__=name, generate=generate)
+
+def fake_world(has_outputs):
+    return types.SimpleNamespace(
+        has_cell_property=lambda name: has_outputs,
+        has_param=lambda name: has_outputs,
+        record_entities=lambda: contextlib.nullcontext([]),
+        commit_entities=lambda entities: None,
+    )
+
+class SchedulerTestCase(unittest.TestCase):
+    def test_order(self):
+        sched = scheduler.Scheduler([
+            plugin('biome', cellprops=['temperature', 'moisture'], produces=['biome']),
+            plugin('climate', cellprops=['celltype'], produces=['temperature']),
+            plugin('moisture', cellprops=['celltype'], produces=['moisture']),
+            plugin('terrain', produces=['celltype']),
+        ])
+
+        self.assertEqual(sched.order, ['terrain', 'climate', 'moisture', 'biome'])
+        self.assertEqual(sched.depends_on['biome'], set(['climate', 'moisture']))
+        self.assertEqual(sched.depends_on['climate'], set(['terrain']))
+
+    def test_mutator_runs_before_readers(self):
+        sched = scheduler.Scheduler([
+            plugin('landforms', cellprops=['celltype'], produces=['landform_id']),
+            plugin('lakes', mutates=['celltype']),
+            plugin('terrain', produces=['celltype']),
+        ])
+
+        self.assertEqual(sched.order, ['terrain', 'lakes', 'landforms'])
+
+    def test_write_conflicts(self):
+        with self.assertRaises(errors.WriteConflictError):
+            scheduler.Scheduler([
+                plugin('terrain', produces=['celltype']),
+                plugin('lakes', produces=['celltype']),
+            ])
+
+        with self.assertRaises(errors.WriteConflictError):
+            scheduler.Scheduler([
+                plugin('terrain', produces=['celltype']),
+                plugin('lakes', mutates=['celltype']),
+                plugin('swamps', mutates=['celltype']),
+            ])
+
+        with self.assertRaises(errors.WriteConflictError):
+            scheduler.Scheduler([
+                plugin('terrain', produces=['celltype']),
+                plugin('lakes', cellprops=['celltype'], produces=['celltype']),
+            ])
+
+    def test_unsatisfiable(self):
+        with self.assertRaises(errors.UnsatisfiableDependencyError):
+            scheduler.Scheduler([
+                plugin('climate', cellprops=['celltype'], produces=['temperature']),
+            ])
+
+    def test_cycle(self):
+        with self.assertRaises(errors.DependencyCycleError):
+            scheduler.Scheduler([
+                plugin('first', cellprops=['b'], produces=['a']),
+                plugin('second', cellprops=['a'], produces=['b']),
+            ])
+
+    def test_missing_output(self):
+        sched = scheduler.Scheduler([
+            plugin('terrain', produces=['celltype']),
+        ])
+
+        w = fake_world(False)
+
+        with self.assertRaises(errors.MissingOutputError):
+            sched.run(w, None)
+
+    def test_run(self):
+        log = []
+        sched = scheduler.Scheduler([
+            plugin('biome', log, cellprops=['temperature', 'moisture'], produces=['biome']),
+            plugin('climate', log, cellprops=['celltype'], produces=['temperature']),
+            plugin('moisture', log, cellprops=['celltype'], produces=['moisture']),
+            plugin('terrain', log, produces=['celltype']),
+        ])
+
+        w = fake_world(True)
+
+        sched.run(w, None, workers=4)
+
+        self.assertEqual(len(log), 4)
+        self.assertEqual(log[0], 'terrain')
+        self.assertEqual(log[-1], 'biome')
+
+    def test_entity_order(self):
+        def spawner(name, delay, **reqs):
+            @genreq(**reqs)
+            def generate(w, vd):
+                # Later plugins in the order finish first when they run concurrently.
+                time.sleep(delay)
+                w.add_entity( Entity(None, name + '-1') )
+                w.add_entity( Entity(None, name + '-2') )
+
+            return types.SimpleNamespace(__name__=name, generate=generate)
+
+        def run(workers):
+            sched = scheduler.Scheduler([
+                spawner('rivers', 0.05),
+                spawner('cities', 0.0),
+                spawner('pois', 0.02),
+            ])
+            w = world.World(list( range(4) ), None, None)
+
+            sched.run(w, None, workers=workers)
+
+            return (sched.order, [e.name for e in w.entities()])
+
+        (order, serial) = run(1)
+        self.assertEqual(serial, [name + suffix for name in order for suffix in ('-1', '-2')])
+        self.assertEqual(run(3)[1], serial)
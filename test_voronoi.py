@@ -1,7 +1,9 @@
-import unittest 
+import unittest, numpy
 
 import voronoi
 
+from scipy.spatial import Voronoi
+
 class VoronoiTestCase(unittest.TestCase):
     '''
     This test is intended to ensure that the pre-built voronoi diagrams haven't changed; if they
@@ -15,4 +17,157 @@ class VoronoiTestCase(unittest.TestCase):
         self.assertEqual(vor.regions[1], [])
         self.assertEqual(vor.regions[2], [5, 1, -1, 4])
 
-        self.assertEqual(len(vor.regions), 101)
\ No newline at end of file
+        self.assertEqual(len(vor.regions), 101)
+
+    def test_region_centroids(self):
+        # Interior cells of a regular grid are squares centered on their points.
+        xs, ys = numpy.meshgrid( numpy.linspace(0.1, 0.9, 5), numpy.linspace(0.1, 0.9, 5) )
+        points = numpy.column_stack((xs.ravel(), ys.ravel()))
+
+        (centroids, valid) = voronoi.region_centroids( Voronoi(points) )
+
+        interior = (xs.ravel() > 0.1) & (xs.ravel() < 0.9) & (ys.ravel() > 0.1) & (ys.ravel() < 0.9)
+
+        self.assertTrue( numpy.all(valid[interior]) )
+        self.assertFalse( numpy.any(valid[~interior]) )
+        numpy.testing.assert_allclose(centroids[interior], points[interior])
+
+    def test_bounded(self):
+        points = numpy.random.default_rng(1).random((200, 2))
+        vor = voronoi.generate(points, n_smooth=1)
+
+        regions = [vor.regions[region_id] for region_id in vor.point_region[:len(points)]]
+        self.assertTrue( all([len(region) > 0 and -1 not in region for region in regions]) )
+
+        vertices = vor.vertices[ numpy.concatenate(regions) ]
+        self.assertTrue( numpy.all((vertices >= -1e-9) & (vertices <= 1 + 1e-9)) )
+
+        # The closed cells tile the unit square exactly.
+        areas = []
+        for region in regions:
+            (x, y) = vor.vertices[region].T
+            areas.append( abs(numpy.dot(x, numpy.roll(y, -1)) - numpy.dot(y, numpy.roll(x, -1))) / 2 )
+
+        self.assertAlmostEqual(sum(areas), 1.0)
+
+    def test_mirror_margin(self):
+        points = numpy.random.default_rng(10).random((400, 2))
+
+        # Only reflecting points near the edges gives the same cells as reflecting all of them.
+        full = Voronoi( voronoi.mirror(points) )
+        near = voronoi.bounded_voronoi(points)
+
+        self.assertLess(len(near.points), len(full.points))
+        self.assertTrue( voronoi.clipped(near, len(points)) )
+
+        (full_centroids, _) = voronoi.region_centroids(full, len(points))
+        (near_centroids, _) = voronoi.region_centroids(near, len(points))
+        numpy.testing.assert_allclose(near_centroids, full_centroids, atol=1e-12)
+
+    def test_unbounded_rejected(self):
+        points = numpy.random.default_rng(11).random((50, 2))
+        vor = Voronoi(points)
+
+        self.assertFalse( voronoi.clipped(vor, len(points)) )
+
+        with self.assertRaises(ValueError):
+            voronoi.VoronoiDiagram(vor, { idx: vor.point_region[idx] for idx in range(len(points)) })
+
+    def test_diagram_storage(self):
+        points = numpy.random.default_rng(2).random((100, 2))
+        vor = voronoi.generate(points, n_smooth=1)
+        vd = voronoi.VoronoiDiagram(vor, { idx: vor.point_region[idx] for idx in range(len(points)) })
+
+        for cell_idx in range(len(points)):
+            region = vor.regions[ vor.point_region[cell_idx] ]
+
+            self.assertEqual(list( vd.get_region(cell_idx, locations=False) ), region)
+            numpy.testing.assert_array_equal(vd.get_region(cell_idx), vor.vertices[region])
+            numpy.testing.assert_allclose(vd.center[cell_idx], vor.vertices[region].mean(axis=0))
+
+            for vertex_id in region:
+                self.assertIn(cell_idx, vd.included_cells(vertex_id))
+
+    def test_cell_mapping(self):
+        points = numpy.random.default_rng(5).random((50, 2))
+        vor = voronoi.generate(points, n_smooth=1)
+        mapping = voronoi.CellMapping.from_points(vor, len(points))
+
+        self.assertEqual(len(mapping), len(points))
+        self.assertEqual(mapping.cell_point.tolist(), list( range(len(points)) ))
+        self.assertEqual(mapping[7], vor.point_region[7])
+
+        # Both directions are inverses of each other; reflections aren't cells.
+        self.assertEqual(mapping.region_cell[mapping.cell_region].tolist(), list( range(len(points)) ))
+        self.assertEqual(mapping.point_cell[:len(points)].tolist(), list( range(len(points)) ))
+        self.assertTrue(numpy.all(mapping.point_cell[len(points):] == -1))
+
+        as_dict = voronoi.CellMapping.of(vor, { idx: vor.point_region[idx] for idx in range(len(points)) })
+        numpy.testing.assert_array_equal(as_dict.cell_region, mapping.cell_region)
+
+    def test_find_cells(self):
+        points = numpy.random.default_rng(3).random((300, 2))
+        vor = voronoi.generate(points, n_smooth=1)
+        vd = voronoi.VoronoiDiagram(vor, { idx: vor.point_region[idx] for idx in range(len(points)) })
+
+        queries = numpy.random.default_rng(4).random((50, 2))
+        cell_idxs = vd.find_cells(queries[:, 0], queries[:, 1])
+
+        # Brute force: the closest site wins.
+        dists = numpy.linalg.norm(vor.points[:len(points), numpy.newaxis, :] - queries, axis=2)
+        numpy.testing.assert_array_equal(cell_idxs, numpy.argmin(dists, axis=0))
+
+        self.assertEqual(vd.find_cell(*queries[0]), cell_idxs[0])
+
+    def test_boundary_ridges(self):
+        points = numpy.random.default_rng(5).random((300, 2))
+        vor = voronoi.generate(points, n_smooth=1)
+        vd = voronoi.VoronoiDiagram(vor, { idx: vor.point_region[idx] for idx in range(len(points)) })
+
+        labels = numpy.where(points[:, 0] < 0.5, 0, 1)
+        labels[points[:, 1] < 0.2] = -1
+
+        by_label = vd.boundary_ridges_by_label(labels)
+        self.assertEqual(sorted(by_label.keys()), [0, 1])
+
+        for label in (0, 1):
+            cell_idxs = numpy.flatnonzero(labels == label)
+            regions = [set(vor.regions[ vor.point_region[idx] ]) for idx in cell_idxs]
+
+            # A ridge is on the outline if it's a side of exactly one of the cells.
+            expected = [
+                ridge for ridge in vor.ridge_vertices
+                if len([region for region in regions if ridge[0] in region and ridge[1] in region]) == 1
+            ]
+
+            expected = sorted( map(sorted, expected) )
+
+            self.assertEqual(sorted( map(sorted, vd.boundary_ridges(cell_idxs).tolist()) ), expected)
+            self.assertEqual(sorted( map(sorted, by_label[label].tolist()) ), expected)
+
+            # Both return the same orientation
+            self.assertEqual(sorted( vd.boundary_ridges(cell_idxs).tolist() ), sorted( by_label[label].tolist() ))
+
+    def test_outline_rings(self):
+        points = numpy.random.default_rng(6).random((2000, 2))
+        vor = voronoi.generate(points)
+        vd = voronoi.VoronoiDiagram(vor, { idx: vor.point_region[idx] for idx in range(len(points)) })
+
+        # A ring of cells around the center has an outer boundary and a hole.
+        radius = numpy.linalg.norm(vd.sites - 0.5, axis=1)
+        rings = vd.outline_rings( numpy.flatnonzero((radius > 0.2) & (radius < 0.4)) )
+
+        self.assertEqual(len(rings), 2)
+        self.assertEqual(sorted([ring.is_hole for ring in rings]), [False, True])
+
+        for ring in rings:
+            self.assertEqual(ring.coords.shape, (len(ring.vertices), 2))
+
+        # Area of the annulus
+        self.assertAlmostEqual(sum([ring.area for ring in rings]), numpy.pi * (0.4 ** 2 - 0.2 ** 2), delta=0.02)
+
+        # All cells together cover the unit square.
+        rings = vd.outline_rings( numpy.arange(len(points)) )
+
+        self.assertEqual(len(rings), 1)
+        self.assertAlmostEqual(rings[0].area, 1.0)
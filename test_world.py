@@ -0,0 +1,92 @@
+import json, os, tempfile, unittest, numpy
+
+import graph, world
+from world import Cell
+
+def line_world():
+    # 0 - 1 - 2 - 3 - 4
+    g = graph.Graph([ (0, 1), (1, 2), (2, 3), (3, 4) ])
+    w = world.World(list( range(5) ), None, g)
+
+    w.add_cell_property('celltype', numpy.array([Cell.Type.WATER,] + [Cell.Type.LAND,] * 4, dtype=object))
+
+    return w
+
+class WorldTestCase(unittest.TestCase):
+    def test_distance_field(self):
+        w = line_world()
+
+        (dist, nearest) = w.distance_field('celltype', Cell.Type.WATER)
+        self.assertEqual(dist.tolist(), [0, 1, 2, 3, 4])
+        self.assertEqual(nearest.tolist(), [0, 0, 0, 0, 0])
+
+        (dist, _) = w.distance_field('celltype', Cell.Type.WATER, max_distance=2)
+        self.assertEqual(dist.tolist(), [0, 1, 2, -1, -1])
+
+    def test_distance_field_memoized(self):
+        w = line_world()
+
+        first = w.distance_field('celltype', Cell.Type.WATER)
+        self.assertIs(w.distance_field('celltype', Cell.Type.WATER), first)
+        self.assertFalse(first[0].flags.writeable)
+
+        # Replacing the cell property drops the field
+        celltype = numpy.array(w.cp_celltype)
+        celltype[4] = Cell.Type.WATER
+        w.add_cell_property('celltype', celltype)
+
+        (dist, _) = w.distance_field('celltype', Cell.Type.WATER)
+        self.assertEqual(dist.tolist(), [0, 1, 2, 1, 0])
+
+        # ...and so does changing it in place.
+        w.cp_celltype[2] = Cell.Type.WATER
+
+        (dist, _) = w.distance_field('celltype', Cell.Type.WATER)
+        self.assertEqual(dist.tolist(), [0, 1, 0, 1, 0])
+
+    def test_subgraph(self):
+        w = line_world()
+
+        land = w.subgraph('celltype', Cell.Type.LAND)
+        self.assertIs(w.subgraph('celltype', Cell.Type.LAND), land)
+        self.assertEqual(list( land.edges() ), [ (1, 2), (2, 3), (3, 4) ])
+
+        celltype = numpy.array(w.cp_celltype)
+        celltype[2] = Cell.Type.WATER
+        w.add_cell_property('celltype', celltype)
+
+        self.assertEqual(list( w.subgraph('celltype', Cell.Type.LAND).edges() ), [ (3, 4) ])
+
+    def test_noise(self):
+        w = line_world()
+        w.add_cell_property('longitude', numpy.linspace(0.1, 0.9, 5))
+        w.add_cell_property('latitude', numpy.linspace(0.2, 0.6, 5))
+
+        field = w.noise()
+        self.assertIs(w.noise(), field)
+        self.assertEqual(field.x.tolist(), w.cp_longitude.tolist())
+
+        w.add_cell_property('latitude', numpy.zeros(5))
+        self.assertEqual(w.noise().y.tolist(), [0.0,] * 5)
+
+    def test_save(self):
+        w = line_world()
+        w.set_param('WaterlineHeight', numpy.float32(0.5))
+        w.set_param('has_lakes', numpy.bool_(True))
+        w.set_param('CoastType', Cell.Type.WATER)
+
+        with tempfile.TemporaryDirectory() as folder:
+            w.save(folder, metadata={ 'point_count': numpy.int64(5) })
+
+            with open(os.path.join(folder, 'world.json')) as fp:
+                saved = json.load(fp)
+
+            self.assertEqual(saved['params'], { 'WaterlineHeight': 0.5, 'has_lakes': True, 'CoastType': Cell.Type.WATER.value })
+            self.assertEqual(saved['point_count'], 5)
+            self.assertEqual(saved['enum_cellprops'], ['celltype'])
+
+            # Anything else is an error rather than a silent conversion.
+            w.set_param('graph', w.graph)
+
+            with self.assertRaises(TypeError):
+                w.save(folder)
@@ -1,202 +1,437 @@
-import numpy
+import collections, itertools, math, numpy
 
-from scipy.spatial import Voronoi
+from scipy.spatial import Voronoi, cKDTree
+
+# Points closer than this many mean cell spacings to an edge are reflected across it.
+MirrorMargin = 3.0
+
+# Slack for vertices that land a hair outside of the unit square.
+BoundsTolerance = 1e-9
+
+class CellMapping(object):
+    '''
+    Lookups between cells, Voronoi regions and the diagram's input points, all as arrays so
+    they work on many cells at once. Each direction is the inverse permutation of the other;
+    regions and points that don't belong to a cell (i.e. reflections outside of a bounded
+    diagram) map to -1.
+
+    - `cell_region` / `region_cell`: cell idx <=> voronoi region idx
+    - `cell_point` / `point_cell`: cell idx <=> index into `vor.points`
+
+    Indexing a mapping with a cell idx returns its region idx, like the dicts it replaces.
+    '''
+
+    def __init__(self, vor, cell_regions):
+        self.cell_region = numpy.asarray(cell_regions, dtype=numpy.intp)
+        cell_count = len(self.cell_region)
+
+        point_region = numpy.asarray(vor.point_region, dtype=numpy.intp)
+
+        region_point = numpy.full(len(vor.regions), -1, dtype=numpy.intp)
+        region_point[point_region] = numpy.arange(len(point_region))
+
+        self.region_cell = numpy.full(len(vor.regions), -1, dtype=numpy.intp)
+        self.region_cell[self.cell_region] = numpy.arange(cell_count)
+
+        self.cell_point = region_point[self.cell_region]
+        self.point_cell = self.region_cell[point_region]
+
+        # Shared by the world, the diagram and the graph, so nobody gets to change them.
+        for arr in (self.cell_region, self.region_cell, self.cell_point, self.point_cell):
+            arr.flags.writeable = False
+
+    @staticmethod
+    def from_points(vor, count):
+        '''
+        Mapping for diagrams built by `generate()`, where cell `i` is the input point `i`.
+        '''
+        return CellMapping(vor, vor.point_region[:count])
+
+    @staticmethod
+    def of(vor, mapping):
+        '''
+        Returns `mapping` as a CellMapping; also accepts a dict or sequence of cell idx => region idx.
+        '''
+        if isinstance(mapping, CellMapping):
+            return mapping
+
+        if isinstance(mapping, dict):
+            mapping = [mapping[cell_idx] for cell_idx in range(len(mapping))]
+
+        return CellMapping(vor, mapping)
+
+    def __len__(self):
+        return len(self.cell_region)
+
+    def __getitem__(self, cell_idx):
+        return self.cell_region[cell_idx]
 
 class VoronoiDiagram(object):
+    '''
+    The spatial layout of a world's cells. Regions are stored in CSR form: the corners of cell
+    `i` are `region_vertices[region_offsets[i]:region_offsets[i + 1]]`, and their locations are
+    the matching rows of `region_points`. The inverse (which cells have each vertex as a corner)
+    is stored the same way in `vertex_offsets` and `vertex_cells`.
+    '''
+
     def __init__(self, vor, mapping):
         self.vor = vor
-        self.mapping = mapping # cell_idx => voronoi_idx
+        self.mapping = CellMapping.of(vor, mapping)
+
+        cell_count = len(self.mapping)
+        regions = [vor.regions[region_idx] for region_idx in self.mapping.cell_region.tolist()]
+        lengths = numpy.fromiter( map(len, regions), dtype=numpy.int32, count=cell_count )
+
+        self.region_offsets = numpy.zeros(cell_count + 1, dtype=numpy.int32)
+        numpy.cumsum(lengths, out=self.region_offsets[1:])
+
+        self.region_vertices = numpy.fromiter(
+            itertools.chain.from_iterable(regions), dtype=numpy.int32, count=self.region_offsets[-1],
+        )
 
-        self.center = {}
+        # Unbounded regions have no polygon to store; only bounded diagrams are supported.
+        if numpy.any(self.region_vertices == -1):
+            raise ValueError('Voronoi diagram has unbounded regions; build it with voronoi.generate()')
 
-        for cell_idx in self.mapping.keys():
-            region = self.get_region(cell_idx)
+        self.region_points = vor.vertices[self.region_vertices]
 
-            if len(region) == 0:
-                self.center[cell_idx] = None
-            else:
-                cell_x = list( map(lambda pt: pt[0], region) )
-                cell_y = list( map(lambda pt: pt[1], region) )
+        # Each region's owner, in the same order as `region_vertices`.
+        region_cells = numpy.repeat( numpy.arange(cell_count, dtype=numpy.int32), lengths )
 
-                center_x = sum(cell_x) / len(cell_x)
-                center_y = sum(cell_y) / len(cell_y)
+        # The mean of each cell's corners.
+        self.center = numpy.column_stack((
+            numpy.bincount(region_cells, weights=self.region_points[:, 0], minlength=cell_count),
+            numpy.bincount(region_cells, weights=self.region_points[:, 1], minlength=cell_count),
+        )) / lengths[:, numpy.newaxis]
 
-                self.center[cell_idx] = (center_x, center_y)
+        # Sort corners by vertex to build the vertex => cells index.
+        by_vertex = numpy.argsort(self.region_vertices, kind='stable')
+        vertex_counts = numpy.bincount(self.region_vertices, minlength=len(vor.vertices))
 
-        self.cells_with_vertex = {}
+        self.vertex_offsets = numpy.zeros(len(vor.vertices) + 1, dtype=numpy.int32)
+        numpy.cumsum(vertex_counts, out=self.vertex_offsets[1:])
 
-        for cell_idx in self.mapping.keys():
-            region = self.get_region(cell_idx, locations=False)
+        self.vertex_cells = region_cells[by_vertex]
 
-            for vertex_id in [idx for idx in region if idx != -1]:
-                if vertex_id not in self.cells_with_vertex:
-                    self.cells_with_vertex[vertex_id] = set()
+        # The input point (site) for each cell, indexed for nearest-neighbor queries.
+        self.sites = vor.points[self.mapping.cell_point]
+        self.site_index = cKDTree(self.sites)
 
-                self.cells_with_vertex[vertex_id].add(cell_idx)
+        # The pair of cells separated by each ridge; reflected points outside of the world are -1.
+        self.ridge_cells = self.mapping.point_cell[vor.ridge_points]
+        self.ridge_vertices = numpy.asarray(vor.ridge_vertices, dtype=numpy.int32)
 
     def get_region(self, cell_idx, locations=True):
         '''
         Get the polygon that defines the region for the specified cell_id/region_id.
-        Returns a list of 2D points, or an empty list if the region isn't defined within
-        the Voronoi diagram; see more about when this happens here:
-
-        https://docs.scipy.org/doc/scipy/reference/generated/scipy.spatial.Voronoi.html
+        Returns an (n, 2) array of points, or the n vertex ids if `locations` is False. Both
+        are views into shared arrays and must not be modified. Diagrams built by `generate()`
+        are bounded, so every cell has a closed polygon inside of the unit square.
         '''
-        v_idx = self.mapping[cell_idx]
-
-        region = [region for region in self.vor.regions[v_idx] if region != -1]
-
-        # if -1 in self.vor.regions[v_idx]:
-        #     return [region for region in self.vor.regions[v_idx] if region != -1]
-        #     print(self.vor.regions[v_idx])
-        #     return []
+        start = self.region_offsets[cell_idx]
+        end = self.region_offsets[cell_idx + 1]
 
         if locations:
-            return list( map(lambda r: self.vor.vertices[r], region) )
-            # return list( map(lambda r: self.vor.vertices[r], self.vor.regions[v_idx]) )
+            return self.region_points[start:end]
         else:
-            return region
+            return self.region_vertices[start:end]
 
     def edges(self):
-        return list( filter(lambda ridge: -1 not in ridge, self.vor.ridge_vertices) )  
+        '''
+        Returns the vertex pairs of all ridges that border at least one cell. Ridges between
+        two of the mirrored points outside of the unit square aren't included.
+        '''
+        borders_cell = numpy.any(self.ridge_cells != -1, axis=1)
+
+        return [tuple(ridge) for ridge in self.ridge_vertices[borders_cell]]
 
     def included_cells(self, vertex_id):
-        return list( self.cells_with_vertex[vertex_id] )
+        '''
+        Returns all cells that have `vertex_id` as one of their corners. Vertices that only
+        belong to mirrored regions don't have any.
+        '''
+        return self.vertex_cells[ self.vertex_offsets[vertex_id]:self.vertex_offsets[vertex_id + 1] ]
 
     def vertex_location(self, vertex_id):
         return self.vor.vertices[vertex_id]
 
     def find_cell(self, x, y):
-        shortest_dist = 100.0
-        shortest_idx = -1
-
-        for cell_idx in self.mapping.keys():
-            center = self.center[cell_idx]
-
-            if center is not None:
-                dist = abs(x - center[0]) + abs(y - center[1])
-
-                if dist < shortest_dist:
-                    shortest_dist = dist
-                    shortest_idx = cell_idx
-        
-        return shortest_idx
-
-    def outline(self, cell_idxs):
-        ridges = []
+        '''
+        Returns the cell containing the point (x, y).
+        '''
+        return int( self.find_cells([x,], [y,])[0] )
 
+    def find_cells(self, xs, ys):
         '''
-        get all allowed regions
-        for all ridge vertices
-            check if ridge is in exactly one region
+        Returns the cell containing each of the points (xs[i], ys[i]). A point is inside of the
+        cell whose site is closest to it, so this is a nearest-neighbor query on the sites.
         '''
-        supported_regions = list( map(lambda idx: self.vor.regions[self.mapping[idx]], cell_idxs) )
+        (_, cell_idxs) = self.site_index.query( numpy.column_stack((xs, ys)) )
+
+        return cell_idxs
 
-        regions_with_ridge = lambda ridge: list( filter(lambda region: ridge[0] in region and ridge[1] in region, supported_regions) )
+    def boundary_ridges(self, cell_idxs):
+        '''
+        Returns a (k, 2) array with the vertex ids of every ridge on the outline of a set of
+        cells. A ridge is on the outline iff exactly one of the two cells it separates is in the set;
+        ridges along the edge of the world separate a cell from one of its reflections.
 
-        for ridge in self.vor.ridge_vertices:
-            if len(regions_with_ridge(ridge)) == 1 and -1 not in ridge:
-                ridges.append(ridge)
+        Ridges are oriented so that the cell inside of the set is on their left, which means
+        outer boundaries run counterclockwise and holes run clockwise.
+        '''
+        in_set = numpy.zeros(len(self.mapping) + 1, dtype=bool)
+        in_set[cell_idxs] = True
 
-        # if sort:
-        #     ridges = self.sort_ridges(ridges)
+        # Reflections have a cell idx of -1, which picks the extra (always False) slot.
+        ridge_in_set = in_set[self.ridge_cells]
+        on_outline = ridge_in_set[:, 0] != ridge_in_set[:, 1]
 
-        return list(map(lambda r: (self.vor.vertices[r[0]], self.vor.vertices[r[1]]), ridges))
+        inside = numpy.where(ridge_in_set[on_outline, 0], self.ridge_cells[on_outline, 0], self.ridge_cells[on_outline, 1])
 
-    def outline_polygons(self, cell_idxs):
-        ridges = []
+        return self._orient(self.ridge_vertices[on_outline], inside)
 
+    def boundary_ridges_by_label(self, labels, ignore=-1):
         '''
-        get all allowed regions
-        for all ridge vertices
-            check if ridge is in exactly one region
+        Outline every group of cells at once, where `labels` assigns a group to each cell and
+        cells labeled `ignore` aren't in any group. Returns a dict of label => (k, 2) array of
+        ridge vertex ids, equivalent to calling boundary_ridges() for each label.
         '''
-        supported_regions = list( map(lambda idx: self.vor.regions[self.mapping[idx]], cell_idxs) )
+        labels = numpy.append(labels, ignore)
+        ridge_labels = labels[self.ridge_cells]
 
-        regions_with_ridge = lambda ridge: list( filter(lambda region: ridge[0] in region and ridge[1] in region, supported_regions) )
+        on_outline = ridge_labels[:, 0] != ridge_labels[:, 1]
 
-        for ridge in self.vor.ridge_vertices:
-            if len(regions_with_ridge(ridge)) == 1 and -1 not in ridge:
-                ridges.append(ridge)
+        # A ridge between two groups is on the outline of both of them; side 0 first, then side 1.
+        owners = ridge_labels[on_outline].T.ravel()
+        inside = self.ridge_cells[on_outline].T.ravel()
+        ridges = numpy.concatenate(( self.ridge_vertices[on_outline], ) * 2)
 
-        polygons = self.sort_ridges(ridges)
+        keep = owners != ignore
+        (owners, ridges) = (owners[keep], self._orient(ridges[keep], inside[keep]))
 
-        for polygon in polygons:
-            yield list(map(lambda r: (self.vor.vertices[r[0]], self.vor.vertices[r[1]]), polygon))
+        order = numpy.argsort(owners, kind='stable')
+        (unique_labels, starts) = numpy.unique(owners[order], return_index=True)
 
-    def sort_ridges(self, ridges):
-        polygons = []
+        return dict( zip(unique_labels.tolist(), numpy.split(ridges[order], starts[1:])) )
+
+    def _orient(self, ridges, inside):
+        '''
+        Flip ridges so that the site of the matching `inside` cell is on their left.
+        '''
+        start = self.vor.vertices[ ridges[:, 0] ]
+        direction = self.vor.vertices[ ridges[:, 1] ] - start
+        to_site = self.sites[inside] - start
+
+        on_right = direction[:, 0] * to_site[:, 1] - direction[:, 1] * to_site[:, 0] < 0
 
-        polygon = [ ridges[0], ]
-        ridges.pop(0)
+        return numpy.where(on_right[:, numpy.newaxis], ridges[:, ::-1], ridges)
 
-        next_id = polygon[0][1]
+    def outline(self, cell_idxs):
+        '''
+        Returns the start and end point of every ridge on the outline of the cells.
+        '''
+        return list(map(lambda r: (self.vor.vertices[r[0]], self.vor.vertices[r[1]]), self.boundary_ridges(cell_idxs)))
 
-        # Store the starting vertex of the polygon. Once we get back, we need to pick a new
-        # polygon_start_id from the remaining vertices. This will cover landforms with multiple
-        # polygons, such as continents with both a coast and lakes.
-        polygon_start_id = next_id
+    def outline_polygons(self, cell_idxs, ridges=None):
+        '''
+        Generator that yields each closed polygon on the outline of the cells as a list of
+        (start, end) points. Pass precomputed `ridges` (i.e. from boundary_ridges_by_label())
+        to skip finding the boundary.
+        '''
+        if ridges is None:
+            ridges = self.boundary_ridges(cell_idxs)
 
-        remaining = len(ridges)
-        while len(ridges) > 0:
-            for idx, ridge in enumerate(ridges):
-                if ridge[0] == next_id:
-                    polygon.append(ridge)
+        if len(ridges) == 0:
+            return
 
-                    ridges.pop(idx)
-                    next_id = ridge[1]
+        polygons = self.sort_ridges(ridges)
 
-                    break
+        for polygon in polygons:
+            yield list(map(lambda r: (self.vor.vertices[r[0]], self.vor.vertices[r[1]]), polygon))
 
-                if ridge[1] == next_id:
-                    polygon.append(ridge)
+    def outline_rings(self, cell_idxs, ridges=None):
+        '''
+        Returns each closed ring on the outline of the cells as a Ring. Outer boundaries have
+        a positive area and holes (i.e. lakes inside of a continent) have a negative area.
+        Pass precomputed `ridges` (i.e. from boundary_ridges_by_label()) to skip finding the
+        boundary.
+        '''
+        if ridges is None:
+            ridges = self.boundary_ridges(cell_idxs)
 
-                    ridges.pop(idx)
-                    next_id = ridge[0]
+        return [self._ring(ridges[ring]) for ring in chain_ridges(ridges)]
 
-                    break
+    def _ring(self, ridges):
+        vertices = ridges[:, 0]
+        coords = self.vor.vertices[vertices]
 
-            # Didn't remove a ridge. Switch to new polygon.
-            if len(ridges) == remaining:
-                polygons.append(polygon)
-                polygon = [ ridges[0], ]
+        (x, y) = coords.T
+        area = ( numpy.dot(x, numpy.roll(y, -1)) - numpy.dot(y, numpy.roll(x, -1)) ) / 2
 
-                ridges.pop(0)
-                next_id = polygon[-1][1]
-            
-            remaining = len(ridges)
-        
-        if len(polygon) > 0:
-            polygons.append(polygon)
+        return Ring(vertices, coords, float(area), bool(area < 0))
 
-        return polygons
+    def sort_ridges(self, ridges):
+        '''
+        Group ridges into closed polygons, each a list of (start, end) vertex pairs in order
+        around the polygon. Ridges must be oriented, like those from boundary_ridges().
+        '''
+        ridges = numpy.asarray(ridges)
+
+        return [list( map(tuple, ridges[ring].tolist()) ) for ring in chain_ridges(ridges)]
+
+Ring = collections.namedtuple('Ring', ['vertices', 'coords', 'area', 'is_hole'])
+
+def chain_ridges(ridges):
+    '''
+    Split oriented ridges ((k, 2) array of start and end vertex ids) into closed rings. Returns
+    a list of index arrays into `ridges`, each listing one ring's ridges in order. Runs in
+    linear time: each ridge is found through a map of the ridges leaving every vertex.
+    '''
+    starts = ridges[:, 0].tolist()
+    ends = ridges[:, 1].tolist()
+
+    leaving = collections.defaultdict(list)
+    for ridge_idx, start in enumerate(starts):
+        leaving[start].append(ridge_idx)
+
+    used = [False,] * len(starts)
+    rings = []
+
+    for first in range(len(starts)):
+        if used[first]:
+            continue
+
+        ring = []
+        ridge_idx = first
+
+        while ridge_idx is not None:
+            used[ridge_idx] = True
+            ring.append(ridge_idx)
+
+            # Back at the start; the ring is closed.
+            if ends[ridge_idx] == starts[first]:
+                break
+
+            # Vertices shared by more than one ring (where two cells touch at a corner) have
+            # several ridges leaving them; any unused one continues a valid ring.
+            candidates = leaving[ ends[ridge_idx] ]
+            while len(candidates) > 0 and used[ candidates[-1] ]:
+                candidates.pop()
+
+            ridge_idx = candidates.pop() if len(candidates) > 0 else None
+
+        rings.append( numpy.array(ring, dtype=numpy.intp) )
+
+    return rings
+
+def region_centroids(vor, count=None):
+    '''
+    Compute the area-weighted centroid of the region around each of the first `count` input
+    points (default: all of them), all at once. Returns (centroids, valid), where `valid` is
+    False for points whose region is unbounded, empty or has no area; their centroids are
+    meaningless.
+    '''
+    regions = [vor.regions[region_id] for region_id in vor.point_region[:count]]
+    lengths = numpy.fromiter( map(len, regions), dtype=numpy.intp, count=len(regions) )
+
+    # Flatten all regions into one array of vertex indices; `owner` maps each entry back to its point.
+    flat = numpy.fromiter( itertools.chain.from_iterable(regions), dtype=numpy.intp, count=lengths.sum() )
+    owner = numpy.repeat( numpy.arange(len(regions)), lengths )
+    starts = numpy.cumsum(lengths) - lengths
+
+    # Index of the next vertex around each polygon, wrapping the last vertex back to the first.
+    following = numpy.arange(len(flat)) + 1
+    following[ (starts + lengths - 1)[lengths > 0] ] = starts[lengths > 0]
+
+    (x0, y0) = vor.vertices[flat].T
+    (x1, y1) = vor.vertices[ flat[following] ].T
+
+    # Shoelace formula; the sign depends on the winding order, which cancels out below.
+    cross = x0 * y1 - x1 * y0
+    area = numpy.bincount(owner, weights=cross, minlength=len(regions)) / 2
+
+    unbounded = numpy.bincount(owner, weights=(flat == -1), minlength=len(regions)) > 0
+    valid = ~unbounded & (lengths > 0) & (numpy.abs(area) > 1e-12)
+
+    safe_area = numpy.where(valid, area, 1.0) * 6
+    centroids = numpy.column_stack((
+        numpy.bincount(owner, weights=(x0 + x1) * cross, minlength=len(regions)) / safe_area,
+        numpy.bincount(owner, weights=(y0 + y1) * cross, minlength=len(regions)) / safe_area,
+    ))
+
+    return (centroids, valid)
+
+def mirror(points, margin=1.0):
+    '''
+    Reflect points in the unit square across each of its four edges. Only points within `margin`
+    of an edge are reflected across it; the default reflects everything. The first len(points)
+    rows of the result are the original points.
+    '''
+    (x, y) = points.T
+
+    return numpy.concatenate((
+        points,
+        numpy.column_stack((-x, y))[x < margin],
+        numpy.column_stack((2.0 - x, y))[x > 1.0 - margin],
+        numpy.column_stack((x, -y))[y < margin],
+        numpy.column_stack((x, 2.0 - y))[y > 1.0 - margin],
+    ))
+
+def clipped(vor, count):
+    '''
+    True if the regions of the first `count` points of `vor` are all closed polygons inside of
+    the unit square.
+    '''
+    regions = [vor.regions[region_id] for region_id in vor.point_region[:count]]
+
+    if not all(len(region) > 0 for region in regions):
+        return False
+
+    flat = numpy.fromiter( itertools.chain.from_iterable(regions), dtype=numpy.intp )
+    if numpy.any(flat == -1):
+        return False
+
+    vertices = vor.vertices[flat]
+
+    return bool( numpy.all((vertices >= -BoundsTolerance) & (vertices <= 1.0 + BoundsTolerance)) )
+
+def bounded_voronoi(points):
+    '''
+    Voronoi diagram of `points` plus their reflections across the edges of the unit square. The
+    shared ridge between a point and its reflection lies on the edge, so the region of every
+    original point is a closed polygon clipped to the unit square.
+
+    Only a cell's near neighbors can shape it, so only points within a few mean cell spacings of
+    an edge are reflected across it. Reflecting more points can only cut a region down to the
+    square, so once every region is inside of the square it's exactly the fully mirrored region;
+    if some aren't, the margin is doubled and the diagram rebuilt.
+    '''
+    margin = MirrorMargin / math.sqrt(len(points))
+
+    while True:
+        vor = Voronoi( mirror(points, margin) )
+
+        if margin >= 1.0 or clipped(vor, len(points)):
+            return vor
+
+        margin *= 2
 
 def generate(points, n_smooth=3):
+    '''
+    Build a relaxed Voronoi diagram for points in the unit square. The diagram is bounded (see
+    bounded_voronoi()), so every cell has a closed polygon inside of the unit square. The
+    original points are the first len(points) points of the diagram (i.e. their regions are
+    `vor.point_region[:len(points)]`).
+    '''
     vor = None
 
     # Make several iterations, using the centroid of the polygons from the previous iteration
-    # as the new point cloud.
+    # as the new point cloud. Every region is closed and inside of the unit square, and so is
+    # its centroid.
     for _ in range(n_smooth):
-        vor = Voronoi(points)
-        new_points = numpy.zeros(points.shape)
-
-        for point_idx, region_id in enumerate(vor.point_region):
-            region = vor.regions[region_id]
-
-            # If the region is undefined, use the original point. If the region is defined, 
-            # use the centroid of the polygon
-            if -1 in region:
-                new_points[point_idx] = points[point_idx]
-            else:
-                centroid = numpy.mean([vor.vertices[idx] for idx in region], 0)
-
-                if centroid[0] >= 0.0 and centroid[0] <= 1.0 and centroid[1] >= 0.0 and centroid[1] <= 1.0:
-                    new_points[point_idx] = centroid
-                else:
-                    new_points[point_idx] = points[point_idx]
-
-        points = new_points
-    
+        vor = bounded_voronoi(points)
+        (points, _) = region_centroids(vor, len(points))
+
     return vor
 
 def prebuilt_vor1():
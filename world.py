@@ -1,15 +1,41 @@
-import enum, random, string, numpy
-import errors
+import contextlib, enum, hashlib, json, os, string, threading, zlib, numpy
+import errors, noisefield
 
 from entity import Entity
 
+def random_stream(seed, name):
+    '''
+    Returns a numpy Generator for the stream called `name` derived from `seed`. Streams with
+    different names are statistically independent, and the same (seed, name) pair always
+    produces the same sequence.
+    '''
+    key = zlib.crc32(name.encode('utf-8'))
+
+    return numpy.random.default_rng( numpy.random.SeedSequence(seed, spawn_key=(key,)) )
+
+def json_value(value):
+    '''
+    Convert values that the json module can't serialize on its own: numpy scalars and arrays
+    become Python numbers and lists, and enums (i.e. Cell.Type) are stored by value.
+    '''
+    if isinstance(value, numpy.generic):
+        return value.item()
+
+    if isinstance(value, numpy.ndarray):
+        return value.tolist()
+
+    if isinstance(value, enum.Enum):
+        return value.value
+
+    raise TypeError('Cannot save %s of type %s to world.json' % (repr(value), type(value).__name__))
+
 class Cell(object):
     '''
     Cells represent sections of a World that have certain characteristics like terrain types
     and elevation. Cells are spatially defined by polygons, which are currently equivalent 
     to regions of a Voronoi diagram.
     '''
-    Type = enum.Enum('CellType', 'NONE WATER LAND FIRE')
+    Type = enum.Enum('CellType', 'NONE WATER LAND FIRE', qualname='Cell.Type')
 
 class AbstractCellGroup(object):
     def __init__(self, cell_idxs, vor, graph):
@@ -39,24 +65,59 @@ class World(AbstractCellGroup):
     simulation.
     3) Entities, i.e. cities and rivers.
 
+    All randomness in a world is derived from its seed. Plugins should draw random numbers
+    from `world.rng(__name__)` so the same seed always produces the same world, no matter which
+    order plugins run in.
+
     Worlds do NOT represent the spatial characteristics of cells (VoronoiDiagrams do this) or the
-    relationships between cells (Graphs do this).
+    relationships between cells (Graphs do this). `mapping` is the voronoi.CellMapping from cells
+    to the diagram's regions and points, shared with the VoronoiDiagram.
     '''
 
     StandardDensityCellCount = 3500
 
-    def __init__(self, cells, vor, graph):
+    def __init__(self, cells, vor, graph, seed=0, mapping=None):
         super().__init__(cells, vor, graph)
 
+        self.seed = seed
+        self.mapping = mapping
         self.continents = []
-        self.id = ''.join(random.choices(string.ascii_uppercase + string.digits, k=6))
+
+        id_chars = list(string.ascii_uppercase + string.digits)
+        self.id = ''.join( self.rng('world.id').choice(id_chars, size=6) )
 
         self.__worldparams = {}
         self.__entities = []
+        self.__recording = threading.local()
+
+        # Values derived from cell properties (distance fields, subgraphs), memoized by
+        # cellprop => { key => value } and dropped when the cell property is replaced.
+        self.__derived = {}
+        self.__derived_lock = threading.Lock()
+
+    def rng(self, name):
+        '''
+        Returns a new random number generator for the stream called `name`; plugins pass their
+        module name.
+        '''
+        return random_stream(self.seed, name)
 
     def add_cell_property(self, name, arr):
         setattr(self, 'cp_%s' % (name,), arr)
 
+        # Anything derived from the old values is stale.
+        with self.__derived_lock:
+            self.__derived.pop(name, None)
+
+    def has_cell_property(self, name):
+        return hasattr(self, 'cp_%s' % (name,))
+
+    def cell_properties(self):
+        '''
+        Returns a dict containing all cell property arrays, keyed by name.
+        '''
+        return { key[3:]: value for key, value in vars(self).items() if key.startswith('cp_') }
+
     def new_cp_array(self, dtype, default_value=None):
         if isinstance(default_value, list):
             return numpy.array(default_value, dtype=dtype)
@@ -66,12 +127,90 @@ class World(AbstractCellGroup):
 
         return numpy.array(self.get_cellcount(), dtype=dtype)
 
+    def _derived(self, cellprop, key, build):
+        '''
+        Memoize `build()` under `key` until `cellprop` is replaced. Two threads may both build
+        a missing value; the results are identical so it doesn't matter which one is kept.
+        '''
+        with self.__derived_lock:
+            value = self.__derived.get(cellprop, {}).get(key)
+
+        if value is None:
+            value = build()
+
+            with self.__derived_lock:
+                value = self.__derived.setdefault(cellprop, {}).setdefault(key, value)
+
+        return value
+
+    def _cell_mask(self, cellprop, value):
+        '''
+        Returns a mask of cells where `cellprop` equals `value`, and a digest of the mask.
+        '''
+        mask = getattr(self, 'cp_%s' % (cellprop,)) == value
+
+        return (mask, hashlib.sha1( mask.tobytes() ).digest())
+
+    def distance_field(self, cellprop, value, max_distance=None, graph=None):
+        '''
+        Distance from every cell to the closest cell whose `cellprop` equals `value`, i.e.
+        `world.distance_field('celltype', Cell.Type.WATER)`. Returns (dist, nearest) as
+        described in Graph.distance_field(); the arrays are shared and read-only.
+
+        Fields are computed over `graph` (the world graph by default) and memoized until
+        `cellprop` is replaced with add_cell_property(). The source mask is part of the key as
+        well, so changing a cell property in place never returns a stale field.
+        '''
+        graph = self.graph if graph is None else graph
+        (sources, digest) = self._cell_mask(cellprop, value)
+
+        def build():
+            field = graph.distance_field(sources, max_distance)
+
+            for arr in field:
+                arr.flags.writeable = False
+
+            return field
+
+        return self._derived(cellprop, ('distance_field', graph, digest, max_distance), build)
+
+    def subgraph(self, cellprop, value):
+        '''
+        A view of the world graph with only the cells whose `cellprop` equals `value`, i.e.
+        `world.subgraph('celltype', Cell.Type.LAND)` for the land-only graph. Views share the
+        world graph's arrays and are memoized like distance fields.
+        '''
+        (mask, digest) = self._cell_mask(cellprop, value)
+
+        return self._derived(cellprop, ('subgraph', digest), lambda: self.graph.subgraph(mask))
+
+    def noise(self):
+        '''
+        A noisefield.NoiseField over the location of every cell, i.e.
+        `world.noise().weighted(noise_weights, base)`. The field (and every octave layer it has
+        computed) is shared by all plugins until the cells' latitude or longitude change.
+        '''
+        (x, y) = (self.cp_longitude, self.cp_latitude)
+        digest = hashlib.sha1( x.tobytes() + y.tobytes() ).digest()
+
+        return self._derived('longitude', ('noise', digest), lambda: noisefield.NoiseField(x, y))
+
+    def noise_raster(self, width, height):
+        '''
+        A noisefield.NoiseField over a `width` x `height` raster of the unit square, so the
+        renderer can sample the same continuous fields as the cells at a higher resolution.
+        '''
+        return self._derived(None, ('noise_raster', width, height), lambda: noisefield.NoiseField.raster(width, height))
+
     def set_param(self, name, value):
         self.__worldparams[name] = value
     
     def get_param(self, name):
         return self.__worldparams[name]
     
+    def has_param(self, name):
+        return name in self.__worldparams
+
     def list_params(self):
         return list( self.__worldparams.keys() )
 
@@ -86,9 +225,72 @@ class World(AbstractCellGroup):
 
     def add_entity(self, entity):
         if isinstance(entity, Entity):
-            self.__entities.append(entity)
+            recorder = getattr(self.__recording, 'entities', None)
+
+            if recorder is not None:
+                recorder.append(entity)
+            else:
+                self.__entities.append(entity)
         else:
             raise Exception( 'Trying to add non-Entity: %s' % (type(entity),) )
 
     def entities(self):
-        return self.__entities
\ No newline at end of file
+        return self.__entities
+
+    def commit_entities(self, entities):
+        '''
+        Add entities collected by record_entities() to the world.
+        '''
+        self.__entities.extend(entities)
+
+    @contextlib.contextmanager
+    def record_entities(self):
+        '''
+        Collect the entities added by the current thread while the context is active instead of
+        adding them to the world; pass them to commit_entities() to add them. Other plugins
+        running concurrently on other threads aren't included.
+        '''
+        self.__recording.entities = []
+
+        try:
+            yield self.__recording.entities
+        finally:
+            self.__recording.entities = None
+
+    def save(self, folder, metadata=None):
+        '''
+        Write the world's data to `folder`: all cell properties go into `cells.npz`, and world
+        params, entities and `metadata` go into `world.json`. Cell properties that hold
+        Cell.Type values are stored as their integer values, and so are Cell.Type params.
+        '''
+        metadata = {} if metadata is None else metadata
+        cellprops = {}
+        enum_props = []
+
+        for name, arr in self.cell_properties().items():
+            if arr.dtype == object:
+                arr = numpy.array([val.value for val in arr], dtype=numpy.int8)
+                enum_props.append(name)
+
+            cellprops[name] = arr
+
+        numpy.savez_compressed(os.path.join(folder, 'cells.npz'), **cellprops)
+
+        entities = []
+        for entity in self.__entities:
+            entities.append({
+                'type': type(entity).__name__,
+                'name': entity.name,
+                'cell_idx': int(entity.cell_idx) if hasattr(entity, 'cell_idx') else None,
+            })
+
+        with open(os.path.join(folder, 'world.json'), 'w') as fp:
+            json.dump({
+                'id': self.id,
+                'seed': self.seed,
+                'cell_count': self.get_cellcount(),
+                'params': self.__worldparams,
+                'enum_cellprops': enum_props,
+                'entities': entities,
+                **metadata,
+            }, fp, indent=2, default=json_value)
\ No newline at end of file